@@ -1,20 +1,69 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from .database import SQLAlchemy, configure_binds
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.login_view = 'login'
+login_manager.login_view = 'auth.login'
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_binds(app)
 
     db.init_app(app)
     login_manager.init_app(app)
 
-    from . import routes
-    routes.init_routes(app)
+    from .instrumentation import instrumentation
+    instrumentation.init_app(app)
+
+    from .cache import cache
+    cache.init_app(app)
+
+    from .ratelimit import limiter
+    limiter.init_app(app)
+
+    from .passwords import passwords
+    passwords.init_app(app)
+
+    from .jobs import jobs
+    jobs.init_app(app)
+
+    from .engagement import engagement
+    engagement.init_app(app)
+
+    from .broker import broker
+    broker.init_app(app)
+
+    from .notifications import notifications
+    notifications.init_app(app)
+
+    from .follow_graph import follow_graph
+    follow_graph.init_app(app)
+
+    from .viewer import viewers
+    viewers.init_app(app)
+
+    from .archive import archive
+    archive.init_app(app)
+
+    from .assets import assets
+    assets.init_app(app)
+
+    from .images import images, is_key, media_url, media_srcset
+    images.init_app(app)
+    app.add_template_global(is_key, 'is_media_key')
+    app.add_template_global(media_url)
+    app.add_template_global(media_srcset)
+
+    from . import suggestions
+    suggestions.init_app(app)
+
+    from . import views, commands, entities, feed
+    app.add_template_global(feed.render_card, 'tweet_card')
+    app.add_template_filter(entities.linkify)
+    views.init_app(app)
+    commands.init_commands(app)
 
     return app
@@ -0,0 +1,246 @@
+import heapq
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, create_engine, select
+from . import db
+from .cache import cache
+from .models import Tweet, User
+from .pagination import Page, decode_cursor, encode_cursor, page_size, paginate
+
+# Cold tier for old tweets. The archiver moves tweets older than
+# ARCHIVE_AFTER_DAYS, oldest first, into one compact SQLite file per year
+# (ARCHIVE_DIR/tweets-<year>.db) with their like and retweet counts frozen;
+# their likes, retweets, timeline entries, hashtags and mentions are dropped
+# from the hot database. Because tweets move in (created_at, id) order, every
+# archived tweet sorts before every hot one, so paged reads finish the hot
+# range first and only then continue in the archive. Archived tweets are
+# read-only: they can be shown and deleted, not liked or retweeted.
+#
+# Archiving runs in exactly one process: `flask archive-tweets`, from cron.
+# Its cache.bump('tweets') reaches the workers only through a shared backend
+# (CACHE_TYPE 'file'); per-worker memory caches pick the move up as their
+# entries expire, and until then still resolve the moved tweets here.
+
+metadata = MetaData()
+archived = Table(
+    'tweet', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('content', String(280), nullable=False),
+    Column('image', String(20)),
+    Column('created_at', DateTime, nullable=False),
+    Column('user_id', Integer, nullable=False),
+    Column('like_count', Integer, nullable=False),
+    Column('retweet_count', Integer, nullable=False),
+    Index('ix_tweet_user_created_id', 'user_id', 'created_at', 'id'),
+    Index('ix_tweet_created_id', 'created_at', 'id'),
+    Index('ix_tweet_image', 'image'),
+)
+COLUMNS = [column.name for column in archived.columns]
+PARTITION = re.compile(r'^tweets-(\d{4})\.db$')
+
+
+def _before(position):
+    created_at, tweet_id = position
+    return (archived.c.created_at < created_at) | (
+        (archived.c.created_at == created_at) & (archived.c.id < tweet_id))
+
+
+class Archive:
+    def __init__(self):
+        self.app = None
+        self.directory = None
+        self._engines = {}
+        self._years = []
+        self._listed = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config['ARCHIVE_DIR']
+        self._engines = {}
+        self._listed = 0
+
+    def years(self):
+        # Newest first; other workers' new partitions show up within a minute
+        if time.monotonic() - self._listed > 60:
+            names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+            self._years = sorted((int(m.group(1)) for m in map(PARTITION.match, names) if m), reverse=True)
+            self._listed = time.monotonic()
+        return self._years
+
+    def engine(self, year, create=False):
+        engine = self._engines.get(year)
+        if engine is None:
+            path = os.path.join(self.directory, f'tweets-{year}.db')
+            if not create and not os.path.exists(path):
+                return None
+            with self._lock:
+                engine = self._engines.get(year)
+                if engine is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+                    metadata.create_all(engine)
+                    # Partitions written before an index was added get it here
+                    for index in archived.indexes:
+                        index.create(engine, checkfirst=True)
+                    self._engines[year] = engine
+                    self._listed = 0
+        return engine
+
+    def dispose(self):
+        with self._lock:
+            engines, self._engines = self._engines, {}
+        for engine in engines.values():
+            engine.dispose()
+
+    def _partitions(self, position=None):
+        for year in self.years():
+            if position is None or year <= position[0].year:
+                engine = self.engine(year)
+                if engine is not None:
+                    yield engine
+
+    def older(self, position, limit, user_id=None):
+        """Up to limit (id, created_at) rows from the archive, newest first, below position."""
+        rows = []
+        for engine in self._partitions(position):
+            query = select(archived.c.id, archived.c.created_at)
+            if user_id is not None:
+                query = query.where(archived.c.user_id == user_id)
+            if position:
+                query = query.where(_before(position))
+            with engine.connect() as connection:
+                rows += connection.execute(query.order_by(
+                    archived.c.created_at.desc(), archived.c.id.desc()
+                ).limit(limit - len(rows))).all()
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def by_id(self, user_ids, since_id=None, max_id=None, limit=None):
+        """Archived rows of user_ids, highest id first across every partition, read lazily."""
+        streams = []
+        for engine in self._partitions():
+            query = select(archived).where(archived.c.user_id.in_(user_ids))
+            if since_id:
+                query = query.where(archived.c.id > since_id)
+            if max_id:
+                query = query.where(archived.c.id <= max_id)
+            query = query.order_by(archived.c.id.desc())
+            if limit:
+                query = query.limit(limit)
+            streams.append(_rows_from(engine, query))
+        return heapq.merge(*streams, key=lambda row: row.id, reverse=True)
+
+    def load(self, tweet_ids):
+        """{id: row} for the archived tweets among tweet_ids."""
+        missing = set(tweet_ids)
+        found = {}
+        for engine in self._partitions():
+            if not missing:
+                break
+            with engine.connect() as connection:
+                for row in connection.execute(select(archived).where(archived.c.id.in_(missing))):
+                    found[row.id] = row
+                    missing.discard(row.id)
+        return found
+
+    def images_in_use(self, names):
+        """The image names among names that an archived tweet still shows."""
+        used = set()
+        for engine in self._partitions():
+            with engine.connect() as connection:
+                used.update(connection.execute(select(archived.c.image).where(archived.c.image.in_(names))).scalars())
+        return used
+
+    def delete(self, tweet_ids=None, user_id=None):
+        deleted = []
+        for engine in self._partitions():
+            condition = archived.c.id.in_(tweet_ids) if user_id is None else archived.c.user_id == user_id
+            with engine.begin() as connection:
+                rows = connection.execute(select(archived.c.id, archived.c.user_id, archived.c.image)
+                                          .where(condition)).all()
+                connection.execute(archived.delete().where(condition))
+            deleted += rows
+        if deleted:
+            cache.bump('tweets')
+        return deleted
+
+    def archive_batch(self):
+        """Move one ARCHIVE_BATCH_SIZE batch of old tweets; returns how many moved."""
+        from .purge import delete_tweets
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(days=config['ARCHIVE_AFTER_DAYS'])
+        tweets = Tweet.__table__
+        rows = db.session.execute(select(*[tweets.c[name] for name in COLUMNS]).where(
+            tweets.c.created_at < cutoff
+        ).order_by(tweets.c.created_at, tweets.c.id).limit(config['ARCHIVE_BATCH_SIZE'])).all()
+        db.session.rollback()
+        if not rows:
+            return 0
+        by_year = {}
+        for row in rows:
+            by_year.setdefault(row.created_at.year, []).append(dict(zip(COLUMNS, row)))
+        # Written to the archive before the hot copy goes, so a crash in between leaves a duplicate, not a loss
+        for year, values in by_year.items():
+            with self.engine(year, create=True).begin() as connection:
+                connection.execute(archived.insert().prefix_with('OR REPLACE'), values)
+        delete_tweets([row.id for row in rows], archiving=True)
+        cache.bump('tweets')
+        return len(rows)
+
+    def run(self):
+        moved = 0
+        while True:
+            count = self.archive_batch()
+            moved += count
+            if count < current_app.config['ARCHIVE_BATCH_SIZE']:
+                return moved
+
+
+def _rows_from(engine, query):
+    with engine.connect() as connection:
+        yield from connection.execute(query)
+
+
+archive = Archive()
+
+
+def tweet_page(user_id=None, cursor=None, limit=None):
+    """Keyset page of (id, created_at) for one author or everyone: hot rows, then archived ones."""
+    limit = limit or page_size()
+    query = db.session.query(Tweet.id, Tweet.created_at)
+    if user_id is not None:
+        query = query.filter(Tweet.user_id == user_id)
+    page = paginate(query, Tweet.created_at, Tweet.id, cursor, limit)
+    if page.next_cursor or not archive.years():
+        return page
+    items = list(page.items)
+    if items:
+        position = (items[-1].created_at, items[-1].id)
+    else:
+        position = decode_cursor(cursor) if cursor else None
+    seen = {item.id for item in items}
+    remaining = limit - len(items)
+    # One extra row tells whether another page follows
+    older = [row for row in archive.older(position, remaining + 1, user_id) if row.id not in seen]
+    items += older[:remaining]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(older) > remaining and items else None
+    return Page(items, next_cursor)
+
+
+def hydrate_rows(tweet_ids):
+    """Feed rows for archived tweets, in feed.hydrate()'s column order."""
+    rows = archive.load(tweet_ids) if archive.years() else {}
+    if not rows:
+        return {}
+    authors = {user_id: (username, image) for user_id, username, image in db.session.query(
+        User.id, User.username, User.profile_image
+    ).filter(User.id.in_({row.user_id for row in rows.values()}))}
+    return {tweet_id: (row.id, row.content, row.image, row.created_at, row.user_id, *authors[row.user_id],
+                       row.like_count, row.retweet_count)
+            for tweet_id, row in rows.items() if row.user_id in authors}
@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+from mimetypes import guess_type
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static files are served under content-hashed names (css/style.3f2a9c1b04de.css)
+# so browsers can keep them forever: url_for('static') rewrites the filename,
+# and the static view strips the hash again. CSS and JS are fingerprinted and
+# precompressed (gzip, plus brotli when the package is installed) into
+# ASSET_BUILD_DIR at startup or by `flask build-assets`; other static files
+# (legacy uploads with user filenames) are hashed on first use. A URL whose hash
+# no longer matches the file is still served, without the immutable header.
+#
+# ASSET_SENDFILE hands the body to the front server: 'x-sendfile' for Apache
+# or lighttpd, 'x-accel-redirect' for nginx with an internal location that
+# maps ASSET_ACCEL_PREFIX onto the filesystem root:
+#
+#   location /_files/ { internal; alias /; }
+
+FINGERPRINT = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[A-Za-z0-9]+)$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def fingerprinted(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetPipeline:
+    def __init__(self):
+        self.app = None
+        self.digests = {}
+        self.reload = False
+
+    def init_app(self, app):
+        self.app = app
+        self.digests = {}
+        self.reload = app.debug
+        if app.config['ASSET_SENDFILE'] == 'x-sendfile':
+            app.config['USE_X_SENDFILE'] = True
+        app.url_defaults(self._rewrite)
+        app.view_functions['static'] = self.serve_static
+        if app.config['ASSET_BUILD_ON_STARTUP']:
+            self.build()
+
+    def build(self):
+        """Fingerprint and precompress every CSS/JS file; returns {filename: digest}."""
+        config = self.app.config
+        built = {}
+        for root, _, files in os.walk(self.app.static_folder):
+            for name in files:
+                if os.path.splitext(name)[1] not in config['ASSET_PRECOMPRESS']:
+                    continue
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.app.static_folder).replace(os.sep, '/')
+                digest = file_digest(path)
+                target = os.path.join(config['ASSET_BUILD_DIR'], fingerprinted(filename, digest))
+                if not os.path.exists(target + '.gz'):
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    _write(target + '.gz', gzip.compress(data, 9, mtime=0))
+                    if brotli is not None:
+                        _write(target + '.br', brotli.compress(data))
+                built[filename] = digest
+        self.digests.update(built)
+        return built
+
+    def digest(self, filename):
+        """Content hash of a static file, or None if there is no such file."""
+        digest = None if self.reload else self.digests.get(filename)
+        if digest is None:
+            path = safe_join(self.app.static_folder, filename)
+            if path is None or not os.path.isfile(path):
+                return None
+            digest = self.digests[filename] = file_digest(path)
+        return digest
+
+    def _rewrite(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            digest = self.digest(values['filename'])
+            if digest is not None:
+                values['filename'] = fingerprinted(values['filename'], digest)
+
+    def serve_static(self, filename):
+        match = FINGERPRINT.match(filename)
+        if match is None:
+            return self.send(self.app.static_folder, filename)
+        original = match['stem'] + match['ext']
+        digest = self.digest(original)
+        if digest is None:
+            # A static file whose name happens to look fingerprinted
+            return self.send(self.app.static_folder, filename)
+        return self.send(self.app.static_folder, original, immutable=digest == match['digest'], digest=digest)
+
+    def _precompressed(self, filename, digest):
+        if digest is None:
+            return None, None
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding]:
+                path = os.path.join(current_app.config['ASSET_BUILD_DIR'], fingerprinted(filename, digest) + suffix)
+                if os.path.isfile(path):
+                    return path, encoding
+        return None, None
+
+    def send(self, directory, filename, immutable=False, digest=None):
+        """send_from_directory with ETag, Range, precompressed bodies and sendfile handoff."""
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+        config = current_app.config
+        compressible = os.path.splitext(filename)[1] in config['ASSET_PRECOMPRESS']
+        encoded, encoding = self._precompressed(filename, digest) if compressible else (None, None)
+        mimetype = guess_type(filename)[0] or 'application/octet-stream'
+        max_age = config['ASSET_MAX_AGE'] if immutable else current_app.get_send_file_max_age(filename)
+        etag = f'{digest}-{encoding}' if digest and encoding else digest or True
+
+        if config['ASSET_SENDFILE'] == 'x-accel-redirect':
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = config['ASSET_ACCEL_PREFIX'] + os.path.abspath(encoded or path)
+            if max_age:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+        else:
+            response = send_file(encoded or path, mimetype=mimetype, max_age=max_age, etag=etag, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if compressible:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.immutable = True
+        return response
+
+
+assets = AssetPipeline()
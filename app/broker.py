@@ -0,0 +1,163 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+from flask import Response
+from . import db, events
+from .models import Tweet
+
+# In-process pub/sub behind the /stream Server-Sent Events endpoint. Each
+# connected client holds a Subscription on its own user:<id> channel and on the
+# author:<id> channel of everyone it follows. Event handlers below publish new
+# tweets, deletions and counter changes on the author's channel. Another
+# backend only needs subscribe() and publish(); BROKER_TYPE picks one.
+
+
+class Subscription:
+    def __init__(self, broker, maxsize):
+        self.broker = broker
+        self.channels = set()
+        self.queue = queue.Queue(maxsize)
+
+    def add(self, *channels):
+        self.broker._attach(self, channels)
+
+    def remove(self, *channels):
+        self.broker._detach(self, channels)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.remove(*list(self.channels))
+
+
+class MemoryBroker:
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, self.queue_size)
+        subscription.add(*channels)
+        return subscription
+
+    def _attach(self, subscription, channels):
+        with self._lock:
+            for channel in channels:
+                self._channels[channel].add(subscription)
+                subscription.channels.add(channel)
+
+    def _detach(self, subscription, channels):
+        with self._lock:
+            for channel in channels:
+                listeners = self._channels.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._channels[channel]
+                subscription.channels.discard(channel)
+
+    def listening(self, channel=None):
+        return bool(self._channels) if channel is None else channel in self._channels
+
+    def publish(self, channel, message):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscription in listeners:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # A stalled client loses messages rather than holding up the publisher
+                pass
+        return len(listeners)
+
+
+class NullBroker(MemoryBroker):
+    def listening(self, channel=None):
+        return False
+
+    def publish(self, channel, message):
+        return 0
+
+
+class Broker:
+    def __init__(self):
+        self.backend = NullBroker()
+        self.keepalive = 15
+
+    def init_app(self, app):
+        if app.config['BROKER_TYPE'] == 'memory':
+            self.backend = MemoryBroker(app.config['STREAM_QUEUE_SIZE'])
+        else:
+            self.backend = NullBroker()
+        self.keepalive = app.config['STREAM_KEEPALIVE']
+
+    def subscribe(self, channels):
+        return self.backend.subscribe(channels)
+
+    def publish(self, channel, message):
+        return self.backend.publish(channel, message)
+
+    def listening(self, channel=None):
+        return self.backend.listening(channel)
+
+    def stream(self, user_id, followed_ids):
+        """SSE response for one client; holds no database connection while open."""
+        subscription = self.subscribe([f'user:{user_id}', f'author:{user_id}'] +
+                                      [f'author:{followed_id}' for followed_id in followed_ids])
+
+        def generate():
+            try:
+                yield 'retry: 5000\n\n'
+                while True:
+                    message = subscription.get(self.keepalive)
+                    if message is None:
+                        yield ': keepalive\n\n'
+                    elif message['type'] == 'follow':
+                        subscription.add(f"author:{message['author_id']}")
+                    elif message['type'] == 'unfollow':
+                        subscription.remove(f"author:{message['author_id']}")
+                    else:
+                        yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+            finally:
+                subscription.close()
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+broker = Broker()
+
+
+@events.subscribe('tweet_created')
+def _tweet_created(name, tweet_id, author_id):
+    broker.publish(f'author:{author_id}', {'type': 'tweet', 'tweet_id': tweet_id, 'author_id': author_id})
+
+
+@events.subscribe('tweet_deleted')
+def _tweet_deleted(name, tweet_id, author_id):
+    broker.publish(f'author:{author_id}', {'type': 'delete', 'tweet_id': tweet_id})
+
+
+@events.subscribe('tweet_liked', 'tweet_unliked', 'tweet_retweeted', 'tweet_unretweeted')
+def _tweet_engaged(name, tweet_id, user_id):
+    if not broker.listening():
+        return
+    row = db.session.query(Tweet.user_id, Tweet.like_count, Tweet.retweet_count).filter(Tweet.id == tweet_id).first()
+    if row is not None and broker.listening(f'author:{row.user_id}'):
+        broker.publish(f'author:{row.user_id}', {
+            'type': 'counts', 'tweet_id': tweet_id, 'likes': row.like_count, 'retweets': row.retweet_count
+        })
+
+
+@events.subscribe('user_followed', 'user_unfollowed')
+def _follow_changed(name, follower_id, followed_id):
+    kind = 'follow' if name == 'user_followed' else 'unfollow'
+    broker.publish(f'user:{follower_id}', {'type': kind, 'author_id': followed_id})
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from markupsafe import Markup
+from . import events
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class LRUCache:
+    # Per-process LRU with per-entry TTL; a ttl of 0 means no expiry
+    def __init__(self, max_entries=4096, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileCache:
+    # One pickle per key in a shared directory, so every worker on the host sees it.
+    # Each file holds the expiry, then the value, so a sweep can read just the expiry.
+    # Keys nobody reads again (card fragments keyed by old counts) only go away in
+    # the sweep, which also keeps the directory to max_entries, oldest writes first.
+    def __init__(self, directory, default_ttl=300, max_entries=4096, sweep_interval=60):
+        self.directory = directory
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._sweeping = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires = pickle.load(f)
+                if expires and expires < time.time():
+                    value = None
+                else:
+                    value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if value is None:
+            self.delete(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(expires, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def sweep(self):
+        """Remove expired entries, then the oldest ones beyond max_entries."""
+        if not self._sweeping.acquire(blocking=False):
+            return 0
+        try:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            now = time.time()
+            live = []
+            removed = 0
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    # CACHE_DIR is shared with other files (ratelimit.db, assets/): only touch ours
+                    ours = len(entry.name) == 40 or entry.name.startswith('.tmp')
+                    if not ours or not entry.is_file():
+                        continue
+                    try:
+                        written = entry.stat().st_mtime
+                        if entry.name.startswith('.tmp'):
+                            # Left behind by a writer that died mid-set
+                            expired = written < now - self.sweep_interval
+                        else:
+                            with open(entry.path, 'rb') as f:
+                                expires = pickle.load(f)
+                            expired = expires and expires < now
+                    except (OSError, EOFError, pickle.UnpicklingError):
+                        expired = True
+                    if expired:
+                        removed += self._remove(entry.path)
+                    elif not entry.name.startswith('.tmp'):
+                        live.append((written, entry.path))
+            if len(live) > self.max_entries:
+                live.sort()
+                for _, path in live[:len(live) - self.max_entries]:
+                    removed += self._remove(path)
+            return removed
+        finally:
+            self._sweeping.release()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            return 0
+        return 1
+
+
+class Cache:
+    def __init__(self):
+        self.backend = LRUCache()
+
+    def init_app(self, app):
+        kind = app.config['CACHE_TYPE']
+        ttl = app.config['CACHE_DEFAULT_TTL']
+        if kind == 'file':
+            self.backend = FileCache(app.config['CACHE_DIR'], ttl, app.config['CACHE_MAX_ENTRIES'],
+                                     app.config['CACHE_SWEEP_INTERVAL'])
+        elif kind == 'memory':
+            self.backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], ttl)
+        else:
+            self.backend = NullCache()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, ttl)
+        return value
+
+    # Namespaced version stamps: bumping one orphans every key built from it.
+    # A missing stamp gets a fresh one, so an evicted stamp can only cause misses.
+    def version(self, namespace):
+        key = f'version:{namespace}'
+        stamp = self.backend.get(key)
+        if stamp is None:
+            stamp = self.bump(namespace)
+        return stamp
+
+    def bump(self, namespace):
+        stamp = time.time_ns()
+        self.backend.set(f'version:{namespace}', stamp, 0)
+        return stamp
+
+    def versions(self, namespaces):
+        # One stamp standing for several namespaces; it changes when any of them is bumped
+        digest = hashlib.sha1()
+        for namespace in namespaces:
+            digest.update(b'%d,' % self.version(namespace))
+        return digest.hexdigest()
+
+    def fragment(self, key, render, ttl=None):
+        return Markup(self.get_or_set(f'fragment:{key}', lambda: str(render()), ttl))
+
+
+cache = Cache()
+
+
+@events.subscribe('tweet_created', 'tweet_deleted')
+def _tweet_written(name, tweet_id, author_id):
+    cache.bump('tweets')
+    cache.bump(f'user:{author_id}')
+
+
+@events.subscribe('tweet_liked', 'tweet_unliked', 'tweet_retweeted', 'tweet_unretweeted')
+def _tweet_engaged(name, tweet_id, user_id):
+    # Only payloads that show this tweet go stale, not every cached page
+    cache.bump(f'tweet:{tweet_id}')
+
+
+@events.subscribe('user_followed', 'user_unfollowed')
+def _follow_changed(name, follower_id, followed_id):
+    cache.bump(f'user:{follower_id}')
+    cache.bump(f'user:{followed_id}')
+
+
+@events.subscribe('profile_updated', 'user_deleted')
+def _profile_updated(name, user_id):
+    cache.bump('tweets')
+    cache.bump(f'user:{user_id}')
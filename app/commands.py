@@ -0,0 +1,63 @@
+import click
+from . import counters, db, migrations, purge, suggestions, timeline, trends
+from .archive import archive
+from .models import User
+
+
+def init_commands(app):
+    @app.cli.command('db-upgrade')
+    @click.option('--target', type=int, default=None, help='Stop at this schema version.')
+    def db_upgrade(target):
+        """Apply pending schema migrations."""
+        version = migrations.upgrade(db.engine, target)
+        click.echo(f'Database schema is at version {version}.')
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Fingerprint and precompress CSS/JS into ASSET_BUILD_DIR."""
+        from .assets import assets
+        for filename, digest in sorted(assets.build().items()):
+            click.echo(f'{filename} -> {digest}')
+
+    @app.cli.command('rebuild-timelines')
+    def rebuild_timelines():
+        """Rebuild every materialized home timeline from the follow graph."""
+        for user in User.query.yield_per(100):
+            timeline.rebuild(user)
+        db.session.commit()
+        click.echo('Timelines rebuilt.')
+
+    @app.cli.command('reconcile-counters')
+    @click.option('--chunk-size', default=1000, show_default=True)
+    def reconcile_counters(chunk_size):
+        """Recompute stored engagement counters and repair any drift."""
+        for counter, repaired in counters.reconcile(chunk_size).items():
+            click.echo(f'{counter}: {repaired} rows repaired')
+
+    @app.cli.command('rebuild-suggestions')
+    def rebuild_suggestions():
+        """Recompute every user's who-to-follow suggestions from the follow graph."""
+        for user_id, in db.session.query(User.id).yield_per(500):
+            suggestions.rebuild(user_id)
+        click.echo('Suggestions rebuilt.')
+
+    @app.cli.command('rebuild-trends')
+    def rebuild_trends():
+        """Recount trending-hashtag buckets for the current window."""
+        trends.rebuild()
+        click.echo('Trend buckets rebuilt.')
+
+    @app.cli.command('archive-tweets')
+    def archive_tweets():
+        """Move tweets older than ARCHIVE_AFTER_DAYS into the yearly archive files."""
+        click.echo(f'Archived {archive.run()} tweets.')
+
+    @app.cli.command('purge-user')
+    @click.argument('username')
+    def purge_user(username):
+        """Delete an account with all its tweets, likes, retweets and follows."""
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}.')
+        purge.delete_account(user.id)
+        click.echo(f'Deleted {username}.')
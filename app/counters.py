@@ -0,0 +1,41 @@
+from sqlalchemy import func, select
+from . import db
+from .models import User, Tweet, Retweet, Like, followers
+
+tweets = Tweet.__table__
+users = User.__table__
+
+
+def _count(table, column, owner):
+    return select(func.count()).select_from(table).where(column == owner.c.id).scalar_subquery()
+
+
+def _repair(owner, column, actual, chunk_size):
+    # Rewrite only drifted rows, one id range per transaction to keep write locks short
+    max_id = db.session.query(func.max(owner.c.id)).scalar() or 0
+    repaired = 0
+    for start in range(0, max_id + 1, chunk_size):
+        result = db.session.execute(owner.update().where(
+            owner.c.id.between(start, start + chunk_size - 1),
+            column != actual
+        ).values({column.key: actual}))
+        repaired += result.rowcount
+        db.session.commit()
+    return repaired
+
+
+def reconcile(chunk_size=1000):
+    likes = Like.__table__
+    retweets = Retweet.__table__
+    return {
+        'tweet.like_count': _repair(tweets, tweets.c.like_count,
+                                    _count(likes, likes.c.tweet_id, tweets), chunk_size),
+        'tweet.retweet_count': _repair(tweets, tweets.c.retweet_count,
+                                       _count(retweets, retweets.c.tweet_id, tweets), chunk_size),
+        'user.tweet_count': _repair(users, users.c.tweet_count,
+                                    _count(tweets, tweets.c.user_id, users), chunk_size),
+        'user.follower_count': _repair(users, users.c.follower_count,
+                                       _count(followers, followers.c.followed_id, users), chunk_size),
+        'user.following_count': _repair(users, users.c.following_count,
+                                        _count(followers, followers.c.follower_id, users), chunk_size),
+    }
@@ -0,0 +1,95 @@
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy, SignallingSession, _EngineConnector
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# Engine profile for SQLite: pooled connections with WAL-friendly pragmas, and an
+# optional read-only bind that GET requests on feed/profile pages are routed to.
+
+READ_BIND = 'read'
+
+
+def _is_memory(uri):
+    return uri.rstrip('/') in ('sqlite:', 'sqlite:/', 'sqlite://') or ':memory:' in uri
+
+
+def configure_binds(app):
+    read_uri = app.config.get('SQLALCHEMY_READ_DATABASE_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+    if app.config.get('DB_READ_SPLIT') and not _is_memory(read_uri):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[READ_BIND] = read_uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+class _ProfiledConnector(_EngineConnector):
+    def get_options(self, sa_url, echo):
+        sa_url, options = super().get_options(sa_url, echo)
+        if sa_url.drivername == 'sqlite' and options.get('poolclass') is not StaticPool:
+            config = self._app.config
+            read = self._bind == READ_BIND
+            pragmas = dict(config.get('SQLITE_PRAGMAS') or {})
+            if read:
+                pragmas['query_only'] = 'ON'
+            options.update(
+                poolclass=QueuePool,
+                pool_size=config['DB_READ_POOL_SIZE'] if read else config['DB_POOL_SIZE'],
+                max_overflow=config['DB_MAX_OVERFLOW'],
+                pool_timeout=config['DB_POOL_TIMEOUT'],
+                sqlite_pragmas=pragmas,
+            )
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['check_same_thread'] = False
+            if 'busy_timeout' in pragmas:
+                connect_args['timeout'] = pragmas['busy_timeout'] / 1000
+        return sa_url, options
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return set_pragmas
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self._db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and g.get('db_read_only'):
+            if self._flushing or clause is None or not clause.is_select:
+                # Once a request writes, its later reads must see those writes
+                g.db_read_only = False
+            else:
+                return self._db.get_engine(self.app, bind=READ_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(_SQLAlchemy):
+    def make_connector(self, app=None, bind=None):
+        return _ProfiledConnector(self, self.get_app(app), bind)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(engine, 'connect', _pragma_listener(pragmas))
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_only(view):
+    # Route this view's SELECTs to the read bind when one is configured
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        binds = current_app.config.get('SQLALCHEMY_BINDS') or {}
+        if request.method in ('GET', 'HEAD') and READ_BIND in binds:
+            g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
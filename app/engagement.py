@@ -0,0 +1,199 @@
+import atexit
+import threading
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert
+from . import db, events
+from .models import User, Tweet, Retweet, Like, bump_counter, followers
+
+# Write-behind path for like, retweet and follow toggles. A toggle records the
+# state the user wants; a flusher thread writes everything queued in one
+# transaction every ENGAGEMENT_FLUSH_INTERVAL seconds. A like/unlike pair
+# that lands between flushes never reaches the database. Writes are
+# idempotent upserts/deletes, so counters only move by rows actually changed.
+# A batch stays visible to state()/delta() until its transaction commits; if
+# the batch fails, its ops are retried one at a time so only the bad one is lost.
+# In sync mode (JOBS_SYNC, or ENGAGEMENT_WRITE_BEHIND off) toggles are
+# written before they return.
+
+LIKE, RETWEET, FOLLOW = 'like', 'retweet', 'follow'
+
+EVENTS = {
+    LIKE: ('tweet_unliked', 'tweet_liked'),
+    RETWEET: ('tweet_unretweeted', 'tweet_retweeted'),
+    FOLLOW: ('user_unfollowed', 'user_followed'),
+}
+
+
+def _stored(kind, user_id, target_id):
+    if kind == FOLLOW:
+        query = db.session.query(followers).filter(
+            followers.c.follower_id == user_id, followers.c.followed_id == target_id
+        )
+    else:
+        model = Like if kind == LIKE else Retweet
+        query = model.query.filter_by(user_id=user_id, tweet_id=target_id)
+    return db.session.query(query.exists()).scalar()
+
+
+def _write_engagement(model, user_id, tweet_id, wanted):
+    table = model.__table__
+    if wanted:
+        return db.session.execute(insert(table).prefix_with('OR IGNORE').values(
+            user_id=user_id, tweet_id=tweet_id, created_at=datetime.utcnow()
+        )).rowcount
+    return -db.session.execute(table.delete().where(
+        table.c.user_id == user_id, table.c.tweet_id == tweet_id
+    )).rowcount
+
+
+def _write_follow(follower_id, followed_id, wanted):
+    from . import timeline
+    if wanted:
+        changed = db.session.execute(insert(followers).prefix_with('OR IGNORE').values(
+            follower_id=follower_id, followed_id=followed_id
+        )).rowcount
+        if changed:
+            timeline.backfill(follower_id, followed_id)
+    else:
+        changed = -db.session.execute(followers.delete().where(
+            followers.c.follower_id == follower_id, followers.c.followed_id == followed_id
+        )).rowcount
+        if changed:
+            timeline.prune(follower_id, followed_id)
+    return changed
+
+
+def write(ops):
+    """Apply {(kind, user_id, target_id): wanted} in one transaction and emit events for real changes."""
+    counters = defaultdict(int)
+    changed = []
+    for (kind, user_id, target_id), wanted in ops.items():
+        if kind == FOLLOW:
+            delta = _write_follow(user_id, target_id, wanted)
+            if delta:
+                counters[User.following_count, user_id] += delta
+                counters[User.follower_count, target_id] += delta
+        else:
+            delta = _write_engagement(Like if kind == LIKE else Retweet, user_id, target_id, wanted)
+            if delta:
+                counters[Tweet.like_count if kind == LIKE else Tweet.retweet_count, target_id] += delta
+        if delta:
+            changed.append((kind, user_id, target_id, wanted))
+    for (column, row_id), delta in counters.items():
+        if delta:
+            bump_counter(column, row_id, delta)
+    db.session.commit()
+    for kind, user_id, target_id, wanted in changed:
+        name = EVENTS[kind][wanted]
+        if kind == FOLLOW:
+            events.emit(name, follower_id=user_id, followed_id=target_id)
+        else:
+            events.emit(name, tweet_id=target_id, user_id=user_id)
+
+
+class EngagementQueue:
+    def __init__(self):
+        self.app = None
+        self.sync = True
+        self._pending = {}
+        self._deltas = defaultdict(int)
+        # The batch being written: still the answer to state()/delta() until it commits
+        self._inflight = {}
+        self._inflight_deltas = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.sync = app.config['JOBS_SYNC'] or not app.config['ENGAGEMENT_WRITE_BEHIND']
+        self.interval = app.config['ENGAGEMENT_FLUSH_INTERVAL']
+        self.batch_size = app.config['ENGAGEMENT_BATCH_SIZE']
+
+    def state(self, kind, user_id, target_id, stored=None):
+        """The toggle's current state, counting writes that are still queued."""
+        key = (kind, user_id, target_id)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._inflight.get(key)
+        if entry is not None:
+            return entry[1]
+        return _stored(kind, user_id, target_id) if stored is None else stored
+
+    def delta(self, kind, target_id):
+        # Queued change to a tweet's like/retweet count, for responses sent before the flush
+        with self._lock:
+            return self._deltas.get((kind, target_id), 0) + self._inflight_deltas.get((kind, target_id), 0)
+
+    def set(self, kind, user_id, target_id, wanted, stored=None):
+        if self.sync:
+            write({(kind, user_id, target_id): wanted})
+            return
+        key = (kind, user_id, target_id)
+        if stored is None and key not in self._pending:
+            stored = self.state(kind, user_id, target_id)
+        with self._lock:
+            entry = self._pending.setdefault(key, [stored, stored])
+            self._deltas[kind, target_id] += int(wanted) - int(entry[1])
+            entry[1] = wanted
+            full = len(self._pending) >= self.batch_size
+        self._start()
+        if full:
+            self._wake.set()
+
+    def toggle(self, kind, user_id, target_id):
+        wanted = not self.state(kind, user_id, target_id)
+        self.set(kind, user_id, target_id, wanted, stored=not wanted)
+        return wanted
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='engagement-flush', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flushing:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight, self._inflight_deltas = batch, self._deltas
+                self._deltas = defaultdict(int)
+            # Flipped back before the flush: nothing to write
+            ops = {key: wanted for key, (stored, wanted) in batch.items() if stored != wanted}
+            try:
+                if ops:
+                    with self.app.app_context():
+                        self._write(ops)
+            finally:
+                with self._lock:
+                    self._inflight, self._inflight_deltas = {}, {}
+
+    def _write(self, ops):
+        try:
+            write(ops)
+        except Exception:
+            db.session.rollback()
+            self.app.logger.warning('Engagement batch of %d failed, retrying one by one', len(ops), exc_info=True)
+            # One bad op must not cost everyone else's toggles
+            for key, wanted in ops.items():
+                try:
+                    write({key: wanted})
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Dropped engagement write %s', key)
+        finally:
+            db.session.remove()
+
+
+engagement = EngagementQueue()
@@ -0,0 +1,51 @@
+import re
+from flask import url_for
+from markupsafe import Markup, escape
+from sqlalchemy import insert
+from . import db
+from .models import User, Hashtag, TweetHashtag, Mention
+
+# #hashtags and @mentions. A tag needs at least one letter so "#1" stays plain text;
+# the lookbehinds skip e-mail addresses and HTML entities such as &#39;.
+HASHTAG = re.compile(r'(?<![\w&])#(\w*[^\W\d]\w*)')
+MENTION = re.compile(r'(?<![\w@])@(\w{1,64})')
+MAX_PER_TWEET = 10
+
+
+def extract(content):
+    tags = list(dict.fromkeys(tag.lower()[:100] for tag in HASHTAG.findall(content or '')))
+    usernames = list(dict.fromkeys(MENTION.findall(content or '')))
+    return tags[:MAX_PER_TWEET], usernames[:MAX_PER_TWEET]
+
+
+def index_tweet(tweet):
+    """Store the tweet's hashtags and mentions; returns the mentioned user ids."""
+    from . import trends
+    tags, usernames = extract(tweet.content)
+    if tags:
+        db.session.execute(insert(Hashtag).prefix_with('OR IGNORE'), [{'name': tag} for tag in tags])
+        hashtag_ids = [hashtag_id for hashtag_id, in db.session.query(Hashtag.id).filter(Hashtag.name.in_(tags))]
+        db.session.execute(insert(TweetHashtag), [
+            {'hashtag_id': hashtag_id, 'tweet_id': tweet.id, 'created_at': tweet.created_at}
+            for hashtag_id in hashtag_ids
+        ])
+        trends.record(hashtag_ids, tweet.created_at)
+    mentioned = []
+    if usernames:
+        mentioned = [user_id for user_id, in db.session.query(User.id).filter(
+            User.username.in_(usernames), User.id != tweet.user_id
+        )]
+    if mentioned:
+        db.session.execute(insert(Mention), [
+            {'user_id': user_id, 'tweet_id': tweet.id, 'author_id': tweet.user_id, 'created_at': tweet.created_at}
+            for user_id in mentioned
+        ])
+    return mentioned
+
+
+def linkify(content):
+    # Escape first: the patterns cannot match inside the entities escaping produces
+    text = str(escape(content))
+    text = HASHTAG.sub(lambda m: f'<a href="{url_for("main.hashtag", tag=m.group(1).lower())}">#{m.group(1)}</a>', text)
+    text = MENTION.sub(lambda m: f'<a href="{url_for("main.profile", username=m.group(1))}">@{m.group(1)}</a>', text)
+    return Markup(text)
@@ -0,0 +1,29 @@
+from collections import defaultdict
+
+# In-process event hub. Write paths emit after their transaction commits;
+# caches, timelines and other derived state subscribe to keep themselves fresh.
+#
+#   tweet_created / tweet_deleted       tweet_id, author_id
+#   tweet_liked / tweet_unliked         tweet_id, user_id
+#   tweet_retweeted / tweet_unretweeted tweet_id, user_id
+#   user_followed / user_unfollowed     follower_id, followed_id
+#   user_mentioned                      tweet_id, author_id, user_id
+#   profile_updated                     user_id
+#   user_deleted                        user_id
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(*names):
+    def register(handler):
+        for name in names:
+            # Idempotent, so init_app() subscriptions survive building several apps
+            if handler not in _subscribers[name]:
+                _subscribers[name].append(handler)
+        return handler
+    return register
+
+
+def emit(name, **payload):
+    for handler in _subscribers[name]:
+        handler(name, **payload)
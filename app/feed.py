@@ -0,0 +1,101 @@
+from flask import render_template
+from flask_login import current_user
+from . import db
+from .cache import cache
+from .models import User, Tweet, Retweet, Like
+from .pagination import Page
+
+
+class FeedItem:
+    # Flat, template-ready view of a tweet; built in bulk by hydrate()
+    __slots__ = ('id', 'content', 'image', 'created_at', 'author_id', 'author_username',
+                 'author_profile_image', 'likes_count', 'retweets_count', 'liked', 'retweeted',
+                 'retweeted_by', 'retweeters')
+
+    def __init__(self, id, content, image, created_at, author_id, author_username,
+                 author_profile_image, likes_count=0, retweets_count=0, liked=False, retweeted=False):
+        self.id = id
+        self.content = content
+        self.image = image
+        self.created_at = created_at
+        self.author_id = author_id
+        self.author_username = author_username
+        self.author_profile_image = author_profile_image
+        self.likes_count = likes_count
+        self.retweets_count = retweets_count
+        self.liked = liked
+        self.retweeted = retweeted
+        # Set on home timeline items shown because someone the reader follows retweeted them
+        self.retweeted_by = None
+        self.retweeters = 0
+
+    def as_json(self):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'image': self.image,
+            'user_id': self.author_id,
+            'username': self.author_username,
+            'created_at': self.created_at.isoformat(),
+            'likes': self.likes_count,
+            'retweets': self.retweets_count,
+            'liked': self.liked,
+            'retweeted': self.retweeted,
+            'retweeted_by': self.retweeted_by,
+            'retweeters': self.retweeters
+        }
+
+
+def _viewer_set(model, viewer, tweet_ids):
+    return {tweet_id for tweet_id, in db.session.query(model.tweet_id).filter(
+        model.user_id == viewer.id,
+        model.tweet_id.in_(tweet_ids)
+    )}
+
+
+def hydrate(tweet_ids, viewer=None):
+    # At most three queries per page, whatever its size
+    tweet_ids = list(tweet_ids)
+    if not tweet_ids:
+        return []
+    rows = db.session.query(
+        Tweet.id, Tweet.content, Tweet.image, Tweet.created_at,
+        Tweet.user_id, User.username, User.profile_image,
+        Tweet.like_count, Tweet.retweet_count
+    ).join(User, User.id == Tweet.user_id).filter(Tweet.id.in_(tweet_ids))
+    items = {row[0]: FeedItem(*row) for row in rows}
+    missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in items]
+    if missing:
+        from .archive import hydrate_rows
+        items.update((tweet_id, FeedItem(*row)) for tweet_id, row in hydrate_rows(missing).items())
+    liked = _viewer_set(Like, viewer, tweet_ids) if viewer else set()
+    retweeted = _viewer_set(Retweet, viewer, tweet_ids) if viewer else set()
+    feed = []
+    for tweet_id in tweet_ids:
+        item = items.get(tweet_id)
+        if item is None:
+            continue
+        item.liked = tweet_id in liked
+        item.retweeted = tweet_id in retweeted
+        feed.append(item)
+    return feed
+
+
+def hydrate_page(page, viewer=None):
+    items = hydrate((row.id for row in page.items), viewer)
+    attribution = {row.id: row for row in page.items if getattr(row, 'retweeted_by', None)}
+    for item in items:
+        row = attribution.get(item.id)
+        if row is not None:
+            item.retweeted_by = row.retweeted_by
+            item.retweeters = row.retweeters
+    return Page(items, page.next_cursor)
+
+
+def render_card(item):
+    # The key covers every mutable field the card shows, so it never needs invalidating
+    own = current_user.is_authenticated and item.author_id == current_user.id
+    key = (f'card:{item.id}:{item.likes_count}:{item.retweets_count}:{item.liked:d}'
+           f'{item.retweeted:d}{own:d}:{item.author_username}:{item.author_profile_image}:'
+           f'{item.retweeted_by}:{item.retweeters}')
+    return cache.fragment(key, lambda: render_template('_tweet_card.html', tweet=item))
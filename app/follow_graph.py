@@ -0,0 +1,116 @@
+import bisect
+import threading
+from array import array
+from . import db, events
+from .cache import LRUCache
+from .models import followers
+
+# Per-worker adjacency index of the follow graph: for each user touched, the
+# sorted ids they follow and the sorted ids following them, as compact int
+# arrays loaded on first use. Follow events from this worker patch cached
+# arrays in place; FOLLOW_GRAPH_TTL bounds how long a change made in another
+# worker can go unseen. Arrays are replaced, never mutated, so readers need
+# no lock. Queued (not yet written) toggles are overlaid by the callers that
+# answer "do I follow", through engagement.state().
+
+OUT, IN = 'out', 'in'
+
+
+class FollowGraph:
+    def __init__(self):
+        self.entries = LRUCache()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.entries = LRUCache(app.config['FOLLOW_GRAPH_MAX_USERS'], app.config['FOLLOW_GRAPH_TTL'])
+
+    def _load(self, direction, user_id):
+        if direction == OUT:
+            query = db.session.query(followers.c.followed_id).filter(followers.c.follower_id == user_id)
+            column = followers.c.followed_id
+        else:
+            query = db.session.query(followers.c.follower_id).filter(followers.c.followed_id == user_id)
+            column = followers.c.follower_id
+        return array('q', (other_id for other_id, in query.order_by(column)))
+
+    def _ids(self, direction, user_id):
+        # Entries are one-element lists so a patch keeps the entry's original expiry
+        entry = self.entries.get((direction, user_id))
+        if entry is None:
+            entry = [self._load(direction, user_id)]
+            self.entries.set((direction, user_id), entry)
+        return entry[0]
+
+    def followees_of(self, user_id):
+        return self._ids(OUT, user_id)
+
+    def followers_of(self, user_id):
+        return self._ids(IN, user_id)
+
+    def is_following(self, user_id, other_id):
+        ids = self.followees_of(user_id)
+        position = bisect.bisect_left(ids, other_id)
+        return position < len(ids) and ids[position] == other_id
+
+    def following_among(self, user_id, candidate_ids):
+        """The subset of candidate_ids that user_id follows."""
+        ids = self.followees_of(user_id)
+        found = set()
+        for other_id in candidate_ids:
+            position = bisect.bisect_left(ids, other_id)
+            if position < len(ids) and ids[position] == other_id:
+                found.add(other_id)
+        return found
+
+    def mutuals(self, user_id):
+        # Merge walk over the two sorted arrays
+        outgoing, incoming = self.followees_of(user_id), self.followers_of(user_id)
+        result, i, j = [], 0, 0
+        while i < len(outgoing) and j < len(incoming):
+            if outgoing[i] == incoming[j]:
+                result.append(outgoing[i])
+                i += 1
+                j += 1
+            elif outgoing[i] < incoming[j]:
+                i += 1
+            else:
+                j += 1
+        return result
+
+    def _patch(self, direction, user_id, other_id, present):
+        with self._lock:
+            entry = self.entries.get((direction, user_id))
+            if entry is None:
+                return
+            ids = entry[0]
+            position = bisect.bisect_left(ids, other_id)
+            found = position < len(ids) and ids[position] == other_id
+            if present and not found:
+                entry[0] = ids[:position] + array('q', [other_id]) + ids[position:]
+            elif found and not present:
+                entry[0] = ids[:position] + ids[position + 1:]
+
+    def apply(self, follower_id, followed_id, present):
+        self._patch(OUT, follower_id, followed_id, present)
+        self._patch(IN, followed_id, follower_id, present)
+
+
+follow_graph = FollowGraph()
+
+
+@events.subscribe('user_followed', 'user_unfollowed')
+def _follow_changed(name, follower_id, followed_id):
+    follow_graph.apply(follower_id, followed_id, name == 'user_followed')
+
+
+@events.subscribe('user_deleted')
+def _user_deleted(name, user_id):
+    # The user sits in the arrays of everyone they followed or were followed by
+    follow_graph.entries.clear()
+
+
+def follow_states(user_id, candidate_ids):
+    """{candidate_id: following} for user_id, counting toggles still queued for writing."""
+    from .engagement import engagement, FOLLOW
+    following = follow_graph.following_among(user_id, candidate_ids)
+    return {other_id: engagement.state(FOLLOW, user_id, other_id, other_id in following) for other_id in candidate_ids}
@@ -57,3 +57,7 @@ class EditProfileForm(FlaskForm):
             user = User.query.filter_by(email=email.data).first()
             if user is not None:
                 raise ValidationError('Please use a different email address.')
+
+class DeleteAccountForm(FlaskForm):
+    password = PasswordField('Confirm with your password', validators=[DataRequired()])
+    submit = SubmitField('Delete Account')
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import re
+import tempfile
+from flask import url_for
+
+# Uploads are stored under a content hash: the request only streams the file to
+# IMAGE_INCOMING_FOLDER, and a process pool writes metadata-free WebP and JPEG
+# variants to UPLOAD_FOLDER/<kind>/<key>_<variant>.<ext>. Identical uploads
+# share one key. Filenames from before the pipeline are served from static
+# under content-hashed URLs (see assets.py). Pillow and the process pool are
+# imported where they are used, so workers that never see an upload do not pay
+# for them at startup.
+
+VARIANTS = {
+    'tweets': (('thumb', 320), ('feed', 680), ('full', 1600)),
+    'profile_pics': (('thumb', 64), ('feed', 200), ('full', 400)),
+}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+KEY = re.compile(r'^[0-9a-f]{16}$')
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def is_key(name):
+    return bool(name) and KEY.match(name) is not None
+
+
+def _flatten(image):
+    from PIL import Image
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source, directory, key, variants, remove_source=True):
+    # Runs in a worker process; nothing from the original but the pixels is kept
+    from PIL import Image, ImageOps
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            has_alpha = original.mode in ('LA', 'PA') or 'transparency' in original.info
+            original = original.convert('RGBA' if has_alpha else 'RGB')
+        for variant, edge in variants:
+            image = original.copy()
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            for ext, options in (('webp', {'quality': 80, 'method': 4}),
+                                 ('jpg', {'quality': 82, 'optimize': True, 'progressive': True})):
+                output = image if ext == 'webp' else _flatten(image)
+                path = os.path.join(directory, f'{key}_{variant}.{ext}')
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    output.save(f, format=FORMATS[ext], **options)
+                os.replace(tmp, path)
+    if remove_source:
+        os.remove(source)
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.app = None
+        self.executor = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def _submit(self, *args):
+        if self.app.config['JOBS_SYNC']:
+            return render_variants(*args)
+        if self.executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Spawned workers never inherit the server's threads, locks or sockets
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.app.config['IMAGE_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        future = self.executor.submit(render_variants, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future):
+        if future.exception() is not None:
+            self.app.logger.error('Image processing failed', exc_info=future.exception())
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def directory(self, kind):
+        return os.path.join(self.app.config['UPLOAD_FOLDER'], kind)
+
+    def incoming(self, kind):
+        return os.path.join(self.app.config['IMAGE_INCOMING_FOLDER'], kind)
+
+    def is_processed(self, kind, key):
+        # Every file, so a crashed render or a newly added variant gets rendered again
+        directory = self.directory(kind)
+        return all(os.path.exists(os.path.join(directory, f'{key}_{variant}.{ext}'))
+                   for variant, _ in VARIANTS[kind] for ext in FORMATS)
+
+    def pending_source(self, kind, key):
+        path = os.path.join(self.incoming(kind), key)
+        return path if os.path.exists(path) else None
+
+    def store(self, upload, kind):
+        """Save an uploaded image and queue its variants; returns the image key."""
+        incoming = self.incoming(kind)
+        os.makedirs(incoming, exist_ok=True)
+        os.makedirs(self.directory(kind), exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=incoming, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        from PIL import Image, UnidentifiedImageError
+        try:
+            # Only reads the header; decoding happens in the worker
+            with Image.open(tmp):
+                pass
+        except (UnidentifiedImageError, OSError):
+            os.remove(tmp)
+            raise InvalidImage('Unsupported image file.')
+        key = digest.hexdigest()[:16]
+        if self.is_processed(kind, key) or self.pending_source(kind, key):
+            os.remove(tmp)
+            return key
+        source = os.path.join(incoming, key)
+        os.replace(tmp, source)
+        self._submit(source, self.directory(kind), key, VARIANTS[kind])
+        return key
+
+    def render_now(self, kind, key, variant):
+        # A page asked for a variant the pool has not written yet
+        edge = dict(VARIANTS[kind]).get(variant)
+        source = self.pending_source(kind, key)
+        if edge is None or source is None:
+            return False
+        try:
+            render_variants(source, self.directory(kind), key, ((variant, edge),), remove_source=False)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def discard(self, kind, name):
+        directory = self.directory(kind)
+        if is_key(name):
+            paths = [os.path.join(directory, f'{name}_{variant}.{ext}')
+                     for variant, _ in VARIANTS[kind] for ext in FORMATS]
+            paths.append(os.path.join(self.incoming(kind), name))
+        else:
+            paths = [os.path.join(directory, name)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def media_url(kind, name, variant='feed', ext='jpg'):
+    if not is_key(name):
+        return url_for('static', filename=f'{kind}/{name}')
+    return url_for('media.serve', kind=kind, filename=f'{name}_{variant}.{ext}')
+
+
+def media_srcset(kind, name, ext='jpg'):
+    return ', '.join(f'{media_url(kind, name, variant, ext)} {edge}w' for variant, edge in VARIANTS[kind])
+
+
+images = ImagePipeline()
@@ -0,0 +1,214 @@
+import bisect
+import heapq
+import json
+import logging
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from flask.templating import Environment
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request profile: SQL statements and time (every engine, read bind
+# included), template render time and the SQL issued while rendering, total
+# time and response size. Each request gets a Server-Timing header, a JSON log
+# line on the app.requests logger and a sample in the per-route histograms
+# served at /_metrics. Figures are per worker process.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+log = logging.getLogger('app.requests')
+
+
+class RequestProfile:
+    def __init__(self, keep_slowest):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_queries = 0
+        self.template_depth = 0
+        self.slowest = []
+        self.keep_slowest = keep_slowest
+
+    def statement(self, elapsed, statement):
+        self.queries += 1
+        self.db_time += elapsed
+        if self.template_depth:
+            self.template_queries += 1
+        entry = (elapsed, self.queries, statement)
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest and elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def _profile():
+    return g.get('profile') if has_request_context() else None
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        profile = _profile()
+        if profile is None:
+            return super().render(*args, **kwargs)
+        # Included and nested renders (tweet cards) count once, inside the outermost
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - started
+
+
+class TimedEnvironment(Environment):
+    template_class = TimedTemplate
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profile() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile()
+    started = conn.info.get('profile_started')
+    if profile is not None and started:
+        profile.statement(time.perf_counter() - started.pop(), statement)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+METRICS = (
+    ('request_duration_seconds', 'Time from request start to the last body byte.', DURATION_BUCKETS),
+    ('request_db_seconds', 'Time spent executing SQL per request.', DURATION_BUCKETS),
+    ('request_queries', 'SQL statements per request.', QUERY_BUCKETS),
+    ('request_template_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS),
+    ('response_size_bytes', 'Response body size.', SIZE_BUCKETS),
+)
+
+
+class Instrumentation:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._histograms = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['INSTRUMENTATION_ENABLED']
+        if not self.enabled:
+            return
+        self.keep_slowest = app.config['PROFILE_SLOWEST_STATEMENTS']
+        self.server_timing = app.config['SERVER_TIMING']
+        # Must run before anything touches app.jinja_env
+        app.jinja_environment = TimedEnvironment
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        if app.config['REQUEST_LOG']:
+            log.setLevel(logging.INFO)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if app.config['METRICS_ENDPOINT']:
+            app.add_url_rule('/_metrics', 'metrics', self.metrics_view)
+
+    def _start(self):
+        g.profile = RequestProfile(self.keep_slowest)
+
+    def _finish(self, response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        method = request.method
+        if self.server_timing:
+            elapsed = time.perf_counter() - profile.started
+            response.headers['Server-Timing'] = (
+                f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries", '
+                f'tpl;dur={profile.template_time * 1000:.1f}, app;dur={elapsed * 1000:.1f}'
+            )
+        # A streamed body is still running here; close() comes after its last chunk
+        response.call_on_close(lambda: self._record(profile, route, method, response))
+        return response
+
+    def _record(self, profile, route, method, response):
+        elapsed = time.perf_counter() - profile.started
+        size = response.content_length
+        if size is None and not response.is_streamed:
+            size = response.calculate_content_length()
+        samples = {
+            'request_duration_seconds': elapsed,
+            'request_db_seconds': profile.db_time,
+            'request_queries': profile.queries,
+            'request_template_seconds': profile.template_time,
+        }
+        if size is not None:
+            samples['response_size_bytes'] = size
+        labels = f'method="{method}",route="{route}"'
+        with self._lock:
+            key = (labels, response.status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in samples.items():
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    buckets = next(b for n, _, b in METRICS if n == name)
+                    histogram = self._histograms[name, labels] = Histogram(buckets)
+                histogram.observe(value)
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps({
+                'method': method,
+                'route': route,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'db_ms': round(profile.db_time * 1000, 2),
+                'queries': profile.queries,
+                'template_ms': round(profile.template_time * 1000, 2),
+                'template_queries': profile.template_queries,
+                'bytes': size,
+                'slowest': [{'ms': round(seconds * 1000, 2), 'sql': ' '.join(statement.split())[:300]}
+                            for seconds, _, statement in sorted(profile.slowest, reverse=True)],
+            }, separators=(',', ':')))
+
+    def render(self):
+        """Prometheus text exposition of everything recorded so far."""
+        lines = ['# HELP app_requests_total Requests handled.', '# TYPE app_requests_total counter']
+        with self._lock:
+            for (labels, status), count in sorted(self._requests.items()):
+                lines.append(f'app_requests_total{{{labels},status="{status}"}} {count}')
+            for name, help_text, _ in METRICS:
+                lines += [f'# HELP app_{name} {help_text}', f'# TYPE app_{name} histogram']
+                for (metric, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if metric == name:
+                        lines.extend(histogram.lines(f'app_{name}', labels))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
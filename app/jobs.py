@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+# Background work for derived data (suggestions, image variants, ...). Jobs run
+# in their own app context after the request that queued them has committed.
+# JOBS_SYNC runs them inline instead, which keeps tests deterministic.
+
+
+class JobQueue:
+    def __init__(self):
+        self.executor = None
+        self.sync = True
+
+    def init_app(self, app):
+        self.sync = app.config['JOBS_SYNC']
+        if not self.sync and self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=app.config['JOBS_WORKERS'], thread_name_prefix='jobs'
+            )
+
+    def submit(self, fn, *args, **kwargs):
+        executor = self.executor
+        # After shutdown(), or once the interpreter is exiting and the pool
+        # refuses work (the engagement queue's final flush, for one), the job
+        # runs here instead
+        if self.sync or executor is None:
+            return fn(*args, **kwargs)
+        app = current_app._get_current_object()
+        try:
+            return executor.submit(_run, app, fn, args, kwargs)
+        except RuntimeError:
+            return fn(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+def _run(app, fn, args, kwargs):
+    from . import db
+    with app.app_context():
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Background job %s failed', fn.__name__)
+        finally:
+            db.session.remove()
+
+
+jobs = JobQueue()
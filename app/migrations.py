@@ -0,0 +1,438 @@
+from collections import namedtuple
+from flask import current_app
+
+# Versioned, forward-only schema migrations for the SQLite database.
+# The applied version lives in PRAGMA user_version; every step runs in its own
+# transaction and is written so it can also run against a database that was
+# created by an older db_setup.py or by db.create_all().
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(apply):
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+
+def _columns(cursor, table):
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _add_column(cursor, table, column, ddl):
+    if column not in _columns(cursor, table):
+        cursor.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+
+
+@migration(1, 'initial schema')
+def initial_schema(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(64) UNIQUE NOT NULL,
+        email VARCHAR(120) UNIQUE NOT NULL,
+        password_hash VARCHAR(128),
+        bio VARCHAR(500),
+        location VARCHAR(100),
+        website VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        profile_image VARCHAR(20) DEFAULT 'default.jpg' NOT NULL
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS followers (
+        follower_id INTEGER,
+        followed_id INTEGER,
+        PRIMARY KEY (follower_id, followed_id),
+        FOREIGN KEY (follower_id) REFERENCES user (id),
+        FOREIGN KEY (followed_id) REFERENCES user (id)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tweet (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content VARCHAR(280) NOT NULL,
+        image VARCHAR(20),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        user_id INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES user (id)
+    )''')
+    for table in ('retweet', 'like'):
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS "{table}" (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            tweet_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (tweet_id) REFERENCES tweet (id)
+        )''')
+
+
+@migration(2, 'materialized home timeline')
+def home_timeline(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS timeline (
+        user_id INTEGER NOT NULL,
+        tweet_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, tweet_id),
+        FOREIGN KEY (user_id) REFERENCES user (id),
+        FOREIGN KEY (tweet_id) REFERENCES tweet (id),
+        FOREIGN KEY (author_id) REFERENCES user (id)
+    )''')
+    cursor.execute('DROP INDEX IF EXISTS ix_timeline_user_created')
+    cursor.execute('CREATE INDEX ix_timeline_user_created ON timeline (user_id, created_at, tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_timeline_tweet ON timeline (tweet_id)')
+    cursor.execute('''
+    INSERT OR IGNORE INTO timeline (user_id, tweet_id, author_id, created_at)
+    SELECT user_id, id, user_id, created_at FROM tweet
+    UNION ALL
+    SELECT f.follower_id, t.id, t.user_id, t.created_at
+    FROM tweet t JOIN followers f ON f.followed_id = t.user_id''')
+
+
+@migration(3, 'feed pagination indexes')
+def feed_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_tweet_created_id ON tweet (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_tweet_user_created_id ON tweet (user_id, created_at, id)')
+
+
+@migration(4, 'engagement counters')
+def engagement_counters(cursor):
+    for column in ('tweet_count', 'follower_count', 'following_count'):
+        _add_column(cursor, 'user', column, 'INTEGER DEFAULT 0 NOT NULL')
+    for column in ('like_count', 'retweet_count'):
+        _add_column(cursor, 'tweet', column, 'INTEGER DEFAULT 0 NOT NULL')
+    cursor.execute('''
+    UPDATE user SET
+        tweet_count = (SELECT count(*) FROM tweet WHERE tweet.user_id = user.id),
+        follower_count = (SELECT count(*) FROM followers WHERE followed_id = user.id),
+        following_count = (SELECT count(*) FROM followers WHERE follower_id = user.id)''')
+    cursor.execute('''
+    UPDATE tweet SET
+        like_count = (SELECT count(*) FROM "like" WHERE "like".tweet_id = tweet.id),
+        retweet_count = (SELECT count(*) FROM retweet WHERE retweet.tweet_id = tweet.id)''')
+
+
+@migration(5, 'hot lookup indexes and engagement uniqueness')
+def lookup_indexes(cursor):
+    # Racing toggles may have left duplicate rows; keep the oldest before enforcing uniqueness
+    for table in ('like', 'retweet'):
+        cursor.execute(f'''
+        DELETE FROM "{table}" WHERE id NOT IN (
+            SELECT min(id) FROM "{table}" GROUP BY user_id, tweet_id
+        )''')
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_user_tweet ON "{table}" (user_id, tweet_id)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_tweet ON "{table}" (tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_followers_followed ON followers (followed_id, follower_id)')
+    cursor.execute('''
+    UPDATE tweet SET
+        like_count = (SELECT count(*) FROM "like" WHERE "like".tweet_id = tweet.id),
+        retweet_count = (SELECT count(*) FROM retweet WHERE retweet.tweet_id = tweet.id)''')
+
+
+@migration(6, 'who-to-follow suggestions')
+def suggestions(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS suggestion (
+        user_id INTEGER NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        PRIMARY KEY (user_id, candidate_id),
+        FOREIGN KEY (user_id) REFERENCES user (id),
+        FOREIGN KEY (candidate_id) REFERENCES user (id)
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_suggestion_user_score ON suggestion (user_id, score)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_user_follower_count ON user (follower_count)')
+    # Same per-user cap as suggestions.rebuild() and the incremental updates
+    cursor.execute('''
+    INSERT OR REPLACE INTO suggestion (user_id, candidate_id, score)
+    SELECT user_id, candidate_id, score FROM (
+        SELECT f1.follower_id AS user_id, f2.followed_id AS candidate_id, count(*) AS score,
+               row_number() OVER (PARTITION BY f1.follower_id ORDER BY count(*) DESC) AS rank
+        FROM followers f1 JOIN followers f2 ON f2.follower_id = f1.followed_id
+        WHERE f2.followed_id != f1.follower_id
+          AND NOT EXISTS (SELECT 1 FROM followers f3
+                          WHERE f3.follower_id = f1.follower_id AND f3.followed_id = f2.followed_id)
+        GROUP BY f1.follower_id, f2.followed_id
+    ) WHERE rank <= ?''', (current_app.config['SUGGESTIONS_PER_USER'],))
+
+
+@migration(7, 'full-text search')
+def full_text_search(cursor):
+    # External-content FTS5 indexes; triggers keep them in step with every write
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tweet_fts USING fts5(
+        content, content='tweet', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+        username, bio, content='user', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '_'", prefix='1 2 3'
+    )''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS tweet_fts_insert AFTER INSERT ON tweet BEGIN
+        INSERT INTO tweet_fts (rowid, content) VALUES (new.id, new.content);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS tweet_fts_delete AFTER DELETE ON tweet BEGIN
+        INSERT INTO tweet_fts (tweet_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS tweet_fts_update AFTER UPDATE OF content ON tweet BEGIN
+        INSERT INTO tweet_fts (tweet_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO tweet_fts (rowid, content) VALUES (new.id, new.content);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS user_fts_insert AFTER INSERT ON user BEGIN
+        INSERT INTO user_fts (rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS user_fts_delete AFTER DELETE ON user BEGIN
+        INSERT INTO user_fts (user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS user_fts_update AFTER UPDATE OF username, bio ON user BEGIN
+        INSERT INTO user_fts (user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio);
+        INSERT INTO user_fts (rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END''')
+    cursor.execute("INSERT INTO tweet_fts (tweet_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO user_fts (user_fts) VALUES ('rebuild')")
+
+
+@migration(8, 'hashtags, mentions and trend buckets')
+def hashtags_and_mentions(cursor):
+    from .entities import extract
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS hashtag (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) UNIQUE NOT NULL
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tweet_hashtag (
+        hashtag_id INTEGER NOT NULL,
+        tweet_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (hashtag_id, tweet_id),
+        FOREIGN KEY (hashtag_id) REFERENCES hashtag (id),
+        FOREIGN KEY (tweet_id) REFERENCES tweet (id)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS mention (
+        user_id INTEGER NOT NULL,
+        tweet_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, tweet_id),
+        FOREIGN KEY (user_id) REFERENCES user (id),
+        FOREIGN KEY (tweet_id) REFERENCES tweet (id),
+        FOREIGN KEY (author_id) REFERENCES user (id)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trend_bucket (
+        hashtag_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hashtag_id, bucket),
+        FOREIGN KEY (hashtag_id) REFERENCES hashtag (id)
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_tweet_hashtag_created ON tweet_hashtag (hashtag_id, created_at, tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_tweet_hashtag_tweet ON tweet_hashtag (tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_mention_user_created ON mention (user_id, created_at, tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_mention_tweet ON mention (tweet_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_trend_bucket_bucket ON trend_bucket (bucket)')
+    # Trend buckets are left empty; `flask rebuild-trends` fills the current window
+    user_ids = dict(cursor.execute('SELECT username, id FROM user').fetchall())
+    tweets = cursor.execute('SELECT id, user_id, content, created_at FROM tweet').fetchall()
+    for tweet_id, author_id, content, created_at in tweets:
+        tags, usernames = extract(content)
+        for tag in tags:
+            cursor.execute('INSERT OR IGNORE INTO hashtag (name) VALUES (?)', (tag,))
+            cursor.execute('''
+            INSERT OR IGNORE INTO tweet_hashtag (hashtag_id, tweet_id, created_at)
+            SELECT id, ?, ? FROM hashtag WHERE name = ?''', (tweet_id, created_at, tag))
+        for username in usernames:
+            user_id = user_ids.get(username)
+            if user_id is not None and user_id != author_id:
+                cursor.execute('''
+                INSERT OR IGNORE INTO mention (user_id, tweet_id, author_id, created_at)
+                VALUES (?, ?, ?, ?)''', (user_id, tweet_id, author_id, created_at))
+
+
+@migration(9, 'retweets in the home timeline')
+def retweet_timeline_index(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_retweet_user_created ON retweet (user_id, created_at, tweet_id)')
+
+
+@migration(10, 'aggregated notifications')
+def notifications(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notification (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        kind VARCHAR(16) NOT NULL,
+        tweet_id INTEGER,
+        bucket INTEGER NOT NULL,
+        actor_id INTEGER NOT NULL,
+        actor_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        read BOOLEAN NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES user (id),
+        FOREIGN KEY (tweet_id) REFERENCES tweet (id),
+        FOREIGN KEY (actor_id) REFERENCES user (id)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notification_actor (
+        notification_id INTEGER NOT NULL,
+        actor_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (notification_id, actor_id),
+        FOREIGN KEY (notification_id) REFERENCES notification (id),
+        FOREIGN KEY (actor_id) REFERENCES user (id)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notification_unread (
+        user_id INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES user (id)
+    )''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_notification_group
+    ON notification (user_id, kind, ifnull(tweet_id, 0), bucket)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_notification_user_updated ON notification (user_id, updated_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_notification_tweet ON notification (tweet_id)')
+
+
+def _rebuild(cursor, table, ddl):
+    # SQLite cannot alter a constraint: copy into a table created from ddl, swap it in, restore the indexes
+    indexes = [sql for sql, in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+    cursor.execute(ddl.format(name=f'"{table}__new"'))
+    columns = ', '.join(f'"{column}"' for column in
+                        [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}__new")')]
+                        if column in _columns(cursor, table))
+    cursor.execute(f'INSERT INTO "{table}__new" ({columns}) SELECT {columns} FROM "{table}"')
+    cursor.execute(f'DROP TABLE "{table}"')
+    cursor.execute(f'ALTER TABLE "{table}__new" RENAME TO "{table}"')
+    for sql in indexes:
+        cursor.execute(sql)
+
+
+@migration(11, 'cascading deletes for tweet and user children')
+def cascading_deletes(cursor):
+    # Only checked on connections that turn foreign_keys on (purge.py). Denormalized
+    # author/actor/candidate columns lose their foreign key: they have no index, so
+    # checking them would scan the table on every user delete.
+    for table in ('like', 'retweet'):
+        _rebuild(cursor, table, '''
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE,
+            tweet_id INTEGER NOT NULL REFERENCES tweet (id) ON DELETE CASCADE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+    _rebuild(cursor, 'followers', '''
+    CREATE TABLE {name} (
+        follower_id INTEGER REFERENCES user (id) ON DELETE CASCADE,
+        followed_id INTEGER REFERENCES user (id) ON DELETE CASCADE,
+        PRIMARY KEY (follower_id, followed_id)
+    )''')
+    _rebuild(cursor, 'timeline', '''
+    CREATE TABLE {name} (
+        user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE,
+        tweet_id INTEGER NOT NULL REFERENCES tweet (id) ON DELETE CASCADE,
+        author_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, tweet_id)
+    )''')
+    _rebuild(cursor, 'suggestion', '''
+    CREATE TABLE {name} (
+        user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE,
+        candidate_id INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        PRIMARY KEY (user_id, candidate_id)
+    )''')
+    _rebuild(cursor, 'tweet_hashtag', '''
+    CREATE TABLE {name} (
+        hashtag_id INTEGER NOT NULL REFERENCES hashtag (id),
+        tweet_id INTEGER NOT NULL REFERENCES tweet (id) ON DELETE CASCADE,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (hashtag_id, tweet_id)
+    )''')
+    _rebuild(cursor, 'mention', '''
+    CREATE TABLE {name} (
+        user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE,
+        tweet_id INTEGER NOT NULL REFERENCES tweet (id) ON DELETE CASCADE,
+        author_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, tweet_id)
+    )''')
+    _rebuild(cursor, 'notification', '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE,
+        kind VARCHAR(16) NOT NULL,
+        tweet_id INTEGER REFERENCES tweet (id) ON DELETE CASCADE,
+        bucket INTEGER NOT NULL,
+        actor_id INTEGER NOT NULL,
+        actor_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        read BOOLEAN NOT NULL DEFAULT 0
+    )''')
+    _rebuild(cursor, 'notification_actor', '''
+    CREATE TABLE {name} (
+        notification_id INTEGER NOT NULL REFERENCES notification (id) ON DELETE CASCADE,
+        actor_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (notification_id, actor_id)
+    )''')
+    _rebuild(cursor, 'notification_unread', '''
+    CREATE TABLE {name} (
+        user_id INTEGER PRIMARY KEY REFERENCES user (id) ON DELETE CASCADE,
+        count INTEGER NOT NULL DEFAULT 0
+    )''')
+
+
+def latest_version():
+    return max(m.version for m in MIGRATIONS)
+
+
+def current_version(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade(engine, target=None):
+    target = latest_version() if target is None else target
+    raw = engine.raw_connection()
+    connection = raw.connection
+    isolation_level = connection.isolation_level
+    try:
+        # Manage transactions explicitly so DDL and data fixes commit or roll back together
+        connection.isolation_level = None
+        cursor = connection.cursor()
+        # Rebuilding a parent table must not cascade into its children
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for step in sorted(MIGRATIONS, key=lambda m: m.version):
+            if step.version <= version or step.version > target:
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                step.apply(cursor)
+                cursor.execute(f'PRAGMA user_version = {step.version:d}')
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            version = step.version
+        return version
+    finally:
+        connection.isolation_level = isolation_level
+        raw.close()
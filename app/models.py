@@ -1,16 +1,30 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import update
+from sqlalchemy.orm.util import identity_key
 from . import db, login_manager
 
+# Counters are adjusted in SQL so concurrent writers never lose an update
+def bump_counter(column, row_id, delta):
+    model = column.class_
+    db.session.execute(
+        update(model).where(model.id == row_id).values({column.key: column + delta}),
+        execution_options={'synchronize_session': False}
+    )
+    instance = db.session.identity_map.get(identity_key(model, row_id))
+    if instance is not None:
+        db.session.expire(instance, [column.key])
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from .viewer import viewers
+    return viewers.load(int(user_id))
 
 # Association table for followers
 followers = db.Table('followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_followers_followed', 'followed_id', 'follower_id')
 )
 
 class User(db.Model, UserMixin):
@@ -23,6 +37,9 @@ class User(db.Model, UserMixin):
     website = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     profile_image = db.Column(db.String(20), nullable=False, default='default.jpg')
+    tweet_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     tweets = db.relationship('Tweet', backref='author', lazy='dynamic')
     retweets = db.relationship('Retweet', backref='user', lazy='dynamic')
     likes = db.relationship('Like', backref='user', lazy='dynamic')
@@ -33,29 +50,31 @@ class User(db.Model, UserMixin):
                               lazy='dynamic')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from .passwords import passwords
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Upgrades a hash made with older parameters; the caller commits
+        from .passwords import passwords
+        if not passwords.verify(self.password_hash, password):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.password_hash = passwords.hash(password)
+        return True
 
+    # Toggles go through the engagement write-behind queue, which owns the commit
     def follow(self, user):
-        if not self.is_following(user):
-            self.following.append(user)
-            db.session.commit()
+        from .engagement import engagement, FOLLOW
+        engagement.set(FOLLOW, self.id, user.id, True)
 
     def unfollow(self, user):
-        if self.is_following(user):
-            self.following.remove(user)
-            db.session.commit()
+        from .engagement import engagement, FOLLOW
+        engagement.set(FOLLOW, self.id, user.id, False)
 
     def is_following(self, user):
-        return self.following.filter(followers.c.followed_id == user.id).count() > 0
-
-    def followed_tweets(self):
-        followed = Tweet.query.join(followers, (followers.c.followed_id == Tweet.user_id)).filter(
-            followers.c.follower_id == self.id)
-        own = Tweet.query.filter_by(user_id=self.id)
-        return followed.union(own).order_by(Tweet.created_at.desc())
+        from .engagement import engagement, FOLLOW
+        from .follow_graph import follow_graph
+        return engagement.state(FOLLOW, self.id, user.id, follow_graph.is_following(self.id, user.id))
 
 class Tweet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,31 +82,146 @@ class Tweet(db.Model):
     image = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    retweet_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     likes = db.relationship('Like', backref='tweet', lazy='dynamic')
     retweets = db.relationship('Retweet', backref='original_tweet', lazy='dynamic')
+    __table_args__ = (
+        db.Index('ix_tweet_created_id', 'created_at', 'id'),
+        db.Index('ix_tweet_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
+    # The unique (user_id, tweet_id) index makes these toggles idempotent under races
+    def _set(self, kind, user, wanted):
+        from .engagement import engagement
+        engagement.set(kind, user.id, self.id, wanted)
+
+    def _state(self, kind, user):
+        from .engagement import engagement
+        return engagement.state(kind, user.id, self.id)
 
     def like(self, user):
-        if not self.has_liked(user):
-            like = Like(user=user, tweet=self)
-            db.session.add(like)
-            db.session.commit()
+        self._set('like', user, True)
 
     def unlike(self, user):
-        if self.has_liked(user):
-            Like.query.filter_by(user_id=user.id, tweet_id=self.id).delete()
-            db.session.commit()
+        self._set('like', user, False)
 
     def has_liked(self, user):
-        return self.likes.filter_by(user_id=user.id).count() > 0
+        return self._state('like', user)
+
+    def retweet(self, user):
+        self._set('retweet', user, True)
+
+    def unretweet(self, user):
+        self._set('retweet', user, False)
+
+    def has_retweeted(self, user):
+        return self._state('retweet', user)
 
 class Retweet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('uq_retweet_user_tweet', 'user_id', 'tweet_id', unique=True),
+        db.Index('ix_retweet_tweet', 'tweet_id'),
+        db.Index('ix_retweet_user_created', 'user_id', 'created_at', 'tweet_id'),
+    )
 
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('uq_like_user_tweet', 'user_id', 'tweet_id', unique=True),
+        db.Index('ix_like_tweet', 'tweet_id'),
+    )
+
+# Materialized home timeline: one row per (reader, tweet), filled on write
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_timeline_user_created', 'user_id', 'created_at', 'tweet_id'),
+        db.Index('ix_timeline_tweet', 'tweet_id'),
+    )
+
+# Precomputed "who to follow": candidates scored by friends-of-friends count
+class Suggestion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    candidate_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_suggestion_user_score', 'user_id', 'score'),
+    )
+
+# Entities parsed out of tweet text at write time
+class Hashtag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+class TweetHashtag(db.Model):
+    __tablename__ = 'tweet_hashtag'
+    hashtag_id = db.Column(db.Integer, db.ForeignKey('hashtag.id'), primary_key=True)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_tweet_hashtag_created', 'hashtag_id', 'created_at', 'tweet_id'),
+        db.Index('ix_tweet_hashtag_tweet', 'tweet_id'),
+    )
+
+class Mention(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_mention_user_created', 'user_id', 'created_at', 'tweet_id'),
+        db.Index('ix_mention_tweet', 'tweet_id'),
+    )
+
+# Per-hashtag use counts in fixed time buckets, summed with decay by trends.top()
+class TrendBucket(db.Model):
+    __tablename__ = 'trend_bucket'
+    hashtag_id = db.Column(db.Integer, db.ForeignKey('hashtag.id'), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_trend_bucket_bucket', 'bucket'),
+    )
+
+# Aggregated notifications: one row per (recipient, kind, tweet, time bucket),
+# grown by notifications.write() as more people act within the bucket
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweet.id', ondelete='CASCADE'))
+    bucket = db.Column(db.Integer, nullable=False)
+    actor_id = db.Column(db.Integer, nullable=False)
+    actor_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    read = db.Column(db.Boolean, nullable=False, default=False)
+    __table_args__ = (
+        db.Index('uq_notification_group', 'user_id', 'kind', db.func.ifnull(tweet_id, 0), 'bucket', unique=True),
+        db.Index('ix_notification_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_notification_tweet', 'tweet_id'),
+    )
+
+# Who is behind each notification; only ever appended to
+class NotificationActor(db.Model):
+    __tablename__ = 'notification_actor'
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id', ondelete='CASCADE'), primary_key=True)
+    actor_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class UnreadNotifications(db.Model):
+    __tablename__ = 'notification_unread'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
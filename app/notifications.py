@@ -0,0 +1,255 @@
+import atexit
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from flask import current_app, render_template
+from sqlalchemy import insert, text
+from . import db, events
+from .broker import broker
+from .cache import cache
+from .models import Notification, NotificationActor, UnreadNotifications, Tweet, User
+from .pagination import Page, paginate
+
+# Likes, retweets, follows and mentions become notifications through a
+# write-behind aggregator: events are queued in memory and a flusher thread
+# writes them every NOTIFICATIONS_FLUSH_INTERVAL seconds in one transaction.
+# Events for the same recipient, kind and tweet inside one NOTIFICATIONS_WINDOW
+# bucket collapse into a single row ("12 people liked your tweet"); who acted
+# is appended to notification_actor, so repeat likes count once. An unlike
+# does not retract anything. notification_unread holds each user's count of
+# unread rows, which is what the badge and the polling endpoint read.
+
+LIKE, RETWEET, FOLLOW, MENTION = 'like', 'retweet', 'follow', 'mention'
+
+# Insert the group's row or return the existing one; actor_count 0 means it is new
+GROUP = text('''
+INSERT INTO notification (user_id, kind, tweet_id, bucket, actor_id, actor_count, created_at, updated_at, read)
+VALUES (:user_id, :kind, :tweet_id, :bucket, :actor_id, 0, :created_at, :created_at, 0)
+ON CONFLICT (user_id, kind, ifnull(tweet_id, 0), bucket) DO UPDATE SET actor_count = actor_count
+RETURNING id, actor_count, read
+''')
+
+GROW = text('''
+UPDATE notification SET actor_count = actor_count + :added, actor_id = :actor_id,
+    updated_at = max(updated_at, :updated_at), read = 0
+WHERE id = :id
+''')
+
+BUMP_UNREAD = text('''
+INSERT INTO notification_unread (user_id, count) VALUES (:user_id, :delta)
+ON CONFLICT (user_id) DO UPDATE SET count = max(count + :delta, 0)
+''')
+
+
+def _bucket(created_at):
+    return int(created_at.replace(tzinfo=timezone.utc).timestamp()) // current_app.config['NOTIFICATIONS_WINDOW']
+
+
+def write(entries):
+    """Aggregate queued (kind, user_id, actor_id, tweet_id, created_at) entries and commit them."""
+    tweet_ids = {entry[3] for entry in entries if entry[3] is not None}
+    authors = dict(db.session.query(Tweet.id, Tweet.user_id).filter(Tweet.id.in_(tweet_ids))) if tweet_ids else {}
+    groups = {}
+    for kind, user_id, actor_id, tweet_id, created_at in entries:
+        if tweet_id is not None:
+            if tweet_id not in authors:
+                # Deleted before the flush
+                continue
+            user_id = user_id or authors[tweet_id]
+        if user_id == actor_id:
+            continue
+        actors = groups.setdefault((user_id, kind, tweet_id, _bucket(created_at)), {})
+        # Oldest first, so the last entry is the most recent actor
+        actors.pop(actor_id, None)
+        actors[actor_id] = created_at
+
+    unread = defaultdict(int)
+    for (user_id, kind, tweet_id, bucket), actors in groups.items():
+        first = next(iter(actors))
+        notification_id, count, read = db.session.execute(GROUP, {
+            'user_id': user_id, 'kind': kind, 'tweet_id': tweet_id, 'bucket': bucket,
+            'actor_id': first, 'created_at': actors[first]
+        }).one()
+        added = db.session.execute(insert(NotificationActor).prefix_with('OR IGNORE'), [
+            {'notification_id': notification_id, 'actor_id': actor_id, 'created_at': created_at}
+            for actor_id, created_at in actors.items()
+        ]).rowcount
+        if not added:
+            continue
+        actor_id, updated_at = next(reversed(actors.items()))
+        db.session.execute(GROW, {'id': notification_id, 'added': added, 'actor_id': actor_id,
+                                  'updated_at': updated_at})
+        unread[user_id] += 1 if read or not count else 0
+    for user_id, delta in unread.items():
+        if delta:
+            db.session.execute(BUMP_UNREAD, {'user_id': user_id, 'delta': delta})
+    db.session.commit()
+    for user_id in unread:
+        changed(user_id)
+
+
+def changed(user_id):
+    cache.bump(f'notifications:{user_id}')
+    if broker.listening(f'user:{user_id}'):
+        broker.publish(f'user:{user_id}', {'type': 'notifications', 'unread': unread_count(user_id)})
+
+
+def mark_read(user_id):
+    table = Notification.__table__
+    marked = db.session.execute(table.update().where(
+        table.c.user_id == user_id, table.c.read == False  # noqa: E712
+    ).values(read=True)).rowcount
+    db.session.execute(UnreadNotifications.__table__.update().where(
+        UnreadNotifications.user_id == user_id
+    ).values(count=0))
+    db.session.commit()
+    if marked:
+        changed(user_id)
+
+
+def unread_count(user_id):
+    # Cached per worker until the next change here, and at most NOTIFICATIONS_UNREAD_TTL elsewhere
+    def load():
+        return db.session.query(UnreadNotifications.count).filter(
+            UnreadNotifications.user_id == user_id
+        ).scalar() or 0
+    key = f"notifications_unread:{user_id}:{cache.version(f'notifications:{user_id}')}"
+    return cache.get_or_set(key, load, current_app.config['NOTIFICATIONS_UNREAD_TTL'])
+
+
+class NotificationItem:
+    __slots__ = ('id', 'kind', 'tweet_id', 'tweet_content', 'actor_id', 'actor_username',
+                 'actor_profile_image', 'others', 'created_at', 'updated_at', 'read')
+
+    def __init__(self, notification, actor, tweet_content):
+        self.id = notification.id
+        self.kind = notification.kind
+        self.tweet_id = notification.tweet_id
+        self.tweet_content = tweet_content
+        self.actor_id = actor.id
+        self.actor_username = actor.username
+        self.actor_profile_image = actor.profile_image
+        self.others = notification.actor_count - 1
+        self.created_at = notification.created_at
+        self.updated_at = notification.updated_at
+        self.read = notification.read
+
+    def as_json(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'tweet_id': self.tweet_id,
+            'tweet': self.tweet_content,
+            'actor': {'id': self.actor_id, 'username': self.actor_username,
+                      'profile_image': self.actor_profile_image},
+            'others': self.others,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'read': self.read
+        }
+
+
+def hydrate(notifications):
+    actor_ids = {n.actor_id for n in notifications}
+    tweet_ids = {n.tweet_id for n in notifications if n.tweet_id is not None}
+    actors = {u.id: u for u in db.session.query(User.id, User.username, User.profile_image).filter(
+        User.id.in_(actor_ids)
+    )} if actor_ids else {}
+    tweets = dict(db.session.query(Tweet.id, Tweet.content).filter(Tweet.id.in_(tweet_ids))) if tweet_ids else {}
+    return [NotificationItem(n, actors[n.actor_id], tweets.get(n.tweet_id)) for n in notifications
+            if n.actor_id in actors and (n.tweet_id is None or n.tweet_id in tweets)]
+
+
+def page(user_id, cursor=None, limit=None):
+    result = paginate(Notification.query.filter(Notification.user_id == user_id),
+                      Notification.updated_at, Notification.id, cursor, limit,
+                      key=lambda n: (n.updated_at, n.id))
+    return Page(hydrate(result.items), result.next_cursor)
+
+
+def preview(user_id, limit=3):
+    """Rendered dashboard card, cached until the user's notifications change."""
+    return cache.fragment(
+        f"notifications_preview:{user_id}:{cache.version(f'notifications:{user_id}')}",
+        lambda: render_template('_notifications.html', notifications=page(user_id, limit=limit).items)
+    )
+
+
+class NotificationQueue:
+    def __init__(self):
+        self.app = None
+        self.sync = True
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._registered = False
+
+    def init_app(self, app):
+        self.app = app
+        self.sync = app.config['JOBS_SYNC']
+        self.interval = app.config['NOTIFICATIONS_FLUSH_INTERVAL']
+        self.batch_size = app.config['NOTIFICATIONS_BATCH_SIZE']
+        if not self.sync and not self._registered:
+            # Registered before the engagement flusher's hook, so it runs after
+            # it at exit and picks up the events that final flush emits
+            atexit.register(self.flush)
+            self._registered = True
+
+    def add(self, kind, actor_id, user_id=None, tweet_id=None):
+        """Queue a notification; user_id may be left to the flush to resolve from tweet_id."""
+        entry = (kind, user_id, actor_id, tweet_id, datetime.utcnow())
+        if self.sync:
+            write([entry])
+            return
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch_size
+        self._start()
+        if full:
+            self._wake.set()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='notifications-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        with self.app.app_context():
+            try:
+                write(batch)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Dropped %d notifications', len(batch))
+            finally:
+                db.session.remove()
+
+
+notifications = NotificationQueue()
+
+
+@events.subscribe('tweet_liked', 'tweet_retweeted')
+def _tweet_engaged(name, tweet_id, user_id):
+    notifications.add(LIKE if name == 'tweet_liked' else RETWEET, user_id, tweet_id=tweet_id)
+
+
+@events.subscribe('user_followed')
+def _followed(name, follower_id, followed_id):
+    notifications.add(FOLLOW, follower_id, user_id=followed_id)
+
+
+@events.subscribe('user_mentioned')
+def _mentioned(name, tweet_id, author_id, user_id):
+    notifications.add(MENTION, author_id, user_id=user_id, tweet_id=tweet_id)
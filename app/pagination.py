@@ -0,0 +1,48 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, item_id):
+    raw = f'{created_at.isoformat()}|{item_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, item_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def page_size():
+    limit = request.args.get('limit', type=int) or current_app.config['FEED_PAGE_SIZE']
+    return max(1, min(limit, current_app.config['FEED_MAX_PAGE_SIZE']))
+
+
+def paginate(query, created_col, id_col, cursor=None, limit=None,
+             key=lambda item: (item.created_at, item.id)):
+    # Keyset pagination over (created_at, id) descending; the cursor marks the last row served
+    limit = limit or page_size()
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < item_id)
+        ))
+    items = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(*key(items[-1]))
+    return Page(items, next_cursor)
@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Password hashing runs on a small dedicated pool so a burst of logins can
+# only occupy PASSWORD_HASH_WORKERS cores; everything else on the worker keeps
+# running. hashlib's PBKDF2 releases the GIL, so threads hash in parallel.
+# At most PASSWORD_HASH_QUEUE calls wait for a slot; beyond that the request
+# gets a 503 straight away. Hashes made with an older PASSWORD_HASH_METHOD
+# are upgraded on the next successful login. PASSWORD_HASH_WORKERS = 0 hashes
+# inline on the request thread instead.
+
+
+def normalize_method(method):
+    # 'pbkdf2:sha256' means Werkzeug's default iteration count
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        method += f':{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = normalize_method('pbkdf2:sha256')
+        self.salt_length = 16
+        self.sync = True
+        self.executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.method = normalize_method(config['PASSWORD_HASH_METHOD'])
+        self.salt_length = config['PASSWORD_SALT_LENGTH']
+        self.workers = config['PASSWORD_HASH_WORKERS']
+        self.sync = not self.workers
+        self.timeout = config['PASSWORD_HASH_TIMEOUT']
+        self.slots = threading.BoundedSemaphore(self.workers + config['PASSWORD_HASH_QUEUE'])
+
+    def _call(self, fn, *args):
+        if self.sync:
+            return fn(*args)
+        if not self.slots.acquire(blocking=False):
+            raise ServiceUnavailable('Too many sign-ins in progress. Please try again shortly.', retry_after=1)
+        try:
+            if self.executor is None:
+                with self._lock:
+                    if self.executor is None:
+                        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='passwords')
+            try:
+                return self.executor.submit(fn, *args).result(timeout=self.timeout)
+            except TimeoutError:
+                raise ServiceUnavailable('Too many sign-ins in progress. Please try again shortly.', retry_after=1)
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._call(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._call(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return normalize_method(pwhash.split('$', 1)[0]) != self.method
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+passwords = PasswordHasher()
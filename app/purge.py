@@ -0,0 +1,176 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import bindparam, select, text
+from . import db, events, notifications, trends
+from .archive import archive
+from .images import images, is_key
+from .models import User, Tweet, Retweet, Like, TweetHashtag, Notification, Suggestion, followers
+
+# Bulk deletes for tweets and whole accounts, PURGE_BATCH_SIZE rows per
+# transaction so the write lock is only ever held briefly. Chunks run on a
+# connection with foreign_keys on, so deleting a tweet or user cascades to the
+# rows hanging off it (see migration 11); counters stored on other rows are
+# adjusted with set-based updates before the cascade removes what they count.
+
+tweets = Tweet.__table__
+users = User.__table__
+notification_table = Notification.__table__
+
+# Unread notifications about to disappear no longer count towards the badge
+FORGET_UNREAD = text('''
+UPDATE notification_unread SET count = max(count - (
+    SELECT count(*) FROM notification n
+    WHERE n.user_id = notification_unread.user_id AND n.read = 0 AND n.id IN :ids
+), 0)
+WHERE user_id IN (SELECT user_id FROM notification WHERE read = 0 AND id IN :ids)
+''').bindparams(bindparam('ids', expanding=True))
+
+
+@contextmanager
+def cascading():
+    # foreign_keys is per connection and can only change outside a transaction
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+        try:
+            yield connection
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+
+
+def _forget_notifications(connection, condition, recipients):
+    rows = connection.execute(select(notification_table.c.id, notification_table.c.user_id).where(condition)).all()
+    ids = [row.id for row in rows]
+    if ids:
+        connection.execute(FORGET_UNREAD, {'ids': ids})
+        recipients.update(row.user_id for row in rows)
+    return ids
+
+
+def _delete_chunk(connection, ids, archiving, recipients):
+    rows = connection.execute(select(tweets.c.id, tweets.c.user_id, tweets.c.image, tweets.c.created_at)
+                              .where(tweets.c.id.in_(ids))).all()
+    if not rows:
+        return []
+    ids = [row.id for row in rows]
+    _forget_notifications(connection, notification_table.c.tweet_id.in_(ids), recipients)
+    if not archiving:
+        # An archived tweet still exists, counted on its author and long out of the trends window
+        authors = defaultdict(int)
+        for row in rows:
+            authors[row.user_id] += 1
+        for user_id, count in authors.items():
+            connection.execute(users.update().where(users.c.id == user_id).values(
+                tweet_count=users.c.tweet_count - count))
+        hashtags = defaultdict(list)
+        for hashtag_id, tweet_id in connection.execute(select(TweetHashtag.hashtag_id, TweetHashtag.tweet_id)
+                                                       .where(TweetHashtag.tweet_id.in_(ids))):
+            hashtags[tweet_id].append(hashtag_id)
+        for row in rows:
+            if hashtags[row.id]:
+                trends.record(hashtags[row.id], row.created_at, -1, connection)
+    connection.execute(tweets.delete().where(tweets.c.id.in_(ids)))
+    return rows
+
+
+def _discard_images(rows):
+    # A file stays while any tweet, hot or archived, still shows it
+    names = {row.image for row in rows if row.image}
+    if not names:
+        return
+    used = {image for image, in db.session.query(Tweet.image).filter(Tweet.image.in_(names))}
+    used |= archive.images_in_use(names - used)
+    for name in names - used:
+        images.discard('tweets', name)
+
+
+def delete_tweets(tweet_ids, archiving=False):
+    """Delete tweets with their likes, retweets, timeline entries, entities and notifications."""
+    tweet_ids = list(tweet_ids)
+    size = current_app.config['PURGE_BATCH_SIZE']
+    deleted = []
+    recipients = set()
+    with cascading() as connection:
+        for start in range(0, len(tweet_ids), size):
+            with connection.begin():
+                deleted += _delete_chunk(connection, tweet_ids[start:start + size], archiving, recipients)
+    for user_id in recipients:
+        notifications.changed(user_id)
+    if not archiving:
+        _discard_images(deleted)
+        for row in deleted:
+            events.emit('tweet_deleted', tweet_id=row.id, author_id=row.user_id)
+    return len(deleted)
+
+
+def _after_archived(rows):
+    authors = defaultdict(int)
+    for row in rows:
+        authors[row.user_id] += 1
+    for user_id, count in authors.items():
+        db.session.execute(users.update().where(users.c.id == user_id).values(
+            tweet_count=users.c.tweet_count - count))
+    db.session.commit()
+    _discard_images(rows)
+    for row in rows:
+        events.emit('tweet_deleted', tweet_id=row.id, author_id=row.user_id)
+
+
+def delete_archived_tweets(tweet_ids):
+    deleted = archive.delete(tweet_ids=tweet_ids)
+    _after_archived(deleted)
+    return len(deleted)
+
+
+def _delete_edges(connection, table, mine, theirs, user_id, counter, size):
+    # The other side's counter drops by one per edge; no toggle can be half-applied here
+    while True:
+        with connection.begin():
+            other_ids = connection.execute(select(theirs).where(mine == user_id).limit(size)).scalars().all()
+            if not other_ids:
+                return
+            owner = counter.table
+            connection.execute(owner.update().where(owner.c.id.in_(other_ids)).values({counter.key: counter - 1}))
+            connection.execute(table.delete().where(mine == user_id, theirs.in_(other_ids)))
+
+
+def delete_account(user_id):
+    """Remove a user and everything they wrote, chunk by chunk."""
+    size = current_app.config['PURGE_BATCH_SIZE']
+    while True:
+        tweet_ids = [tweet_id for tweet_id, in db.session.query(Tweet.id).filter(
+            Tweet.user_id == user_id
+        ).order_by(Tweet.id).limit(size)]
+        db.session.rollback()
+        if not tweet_ids:
+            break
+        delete_tweets(tweet_ids)
+    archived = archive.delete(user_id=user_id)
+    likes, retweets = Like.__table__, Retweet.__table__
+    profile_image = db.session.query(User.profile_image).filter(User.id == user_id).scalar()
+    db.session.rollback()
+    recipients = set()
+    with cascading() as connection:
+        _delete_edges(connection, likes, likes.c.user_id, likes.c.tweet_id, user_id, tweets.c.like_count, size)
+        _delete_edges(connection, retweets, retweets.c.user_id, retweets.c.tweet_id, user_id,
+                      tweets.c.retweet_count, size)
+        _delete_edges(connection, followers, followers.c.follower_id, followers.c.followed_id, user_id,
+                      users.c.follower_count, size)
+        _delete_edges(connection, followers, followers.c.followed_id, followers.c.follower_id, user_id,
+                      users.c.following_count, size)
+        with connection.begin():
+            # Columns without a foreign key (no index to check it with) are cleared by hand
+            ids = _forget_notifications(connection, notification_table.c.actor_id == user_id, recipients)
+            if ids:
+                connection.execute(notification_table.delete().where(notification_table.c.id.in_(ids)))
+            connection.execute(Suggestion.__table__.delete().where(Suggestion.candidate_id == user_id))
+            connection.execute(users.delete().where(users.c.id == user_id))
+    for recipient in recipients - {user_id}:
+        notifications.changed(recipient)
+    _discard_images(archived)
+    # Uploads are keyed by content, so another account may show the same avatar
+    if is_key(profile_image) and not db.session.query(
+        db.session.query(User.id).filter(User.profile_image == profile_image).exists()
+    ).scalar():
+        images.discard('profile_pics', profile_image)
+    events.emit('user_deleted', user_id=user_id)
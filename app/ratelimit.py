@@ -0,0 +1,173 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+
+# Request throttling, checked before the view runs, so a rejected request
+# never reaches the database or a password hash. RATE_LIMITS names the rules:
+#
+#   'login': {'limit': '10/minute', 'by': 'ip', 'algorithm': 'sliding_window'}
+#
+# 'by' is 'ip' or 'user' (the session's user id, falling back to the IP; read
+# from the cookie, not the database). Bucket state lives in RATELIMIT_STORAGE:
+# 'memory' is per worker, 'sqlite' is one file shared by every worker on the
+# host, 'null' disables limiting.
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(value):
+    """'30/minute' -> (30, 60.0)"""
+    count, _, period = value.partition('/')
+    amount, _, unit = period.strip().partition(' ')
+    if not unit:
+        amount, unit = '1', amount
+    return int(count), float(amount) * PERIODS[unit.rstrip('s')]
+
+
+# Algorithms are pure: (state, now, count, period) -> (allowed, state, retry_after)
+
+def token_bucket(state, now, count, period):
+    rate = count / period
+    tokens, stamp = state if state else (count, now)
+    tokens = min(count, tokens + (now - stamp) * rate)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) / rate
+
+
+def sliding_window(state, now, count, period):
+    # Weighted sum of this fixed window and the previous one
+    window = int(now // period)
+    started, current, previous = state if state else (window, 0, 0)
+    if started != window:
+        previous = current if started == window - 1 else 0
+        current = 0
+    elapsed = now - window * period
+    estimate = previous * (1 - elapsed / period) + current
+    if estimate + 1 <= count:
+        return True, (window, current + 1, previous), 0
+    room = count - current - 1
+    if room >= 0 and previous:
+        retry_after = period * (1 - room / previous) - elapsed
+    else:
+        retry_after = period - elapsed
+    return False, (window, current, previous), retry_after
+
+
+ALGORITHMS = {'token_bucket': token_bucket, 'sliding_window': sliding_window}
+
+
+class MemoryStorage:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._state = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, algorithm, count, period):
+        now = time.time()
+        with self._lock:
+            allowed, state, retry_after = algorithm(self._state.get(key), now, count, period)
+            self._state[key] = state
+            self._state.move_to_end(key)
+            while len(self._state) > self.max_entries:
+                self._state.popitem(last=False)
+        return allowed, retry_after
+
+
+class SQLiteStorage:
+    # One row per key; BEGIN IMMEDIATE serializes the read-modify-write across processes
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, a REAL, b REAL, c REAL, '
+                               'updated REAL NOT NULL)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key, algorithm, count, period):
+        connection = self._connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT a, b, c FROM rate_limit WHERE key = ?', (key,)).fetchone()
+            state = tuple(value for value in row if value is not None) if row else None
+            allowed, state, retry_after = algorithm(state, now, count, period)
+            values = tuple(state) + (None,) * (3 - len(state))
+            connection.execute('INSERT OR REPLACE INTO rate_limit (key, a, b, c, updated) VALUES (?, ?, ?, ?, ?)',
+                               (key, *values, now))
+            self._hits += 1
+            if self._hits % 1000 == 0:
+                connection.execute('DELETE FROM rate_limit WHERE updated < ?', (now - PERIODS['day'],))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+class NullStorage:
+    def hit(self, key, algorithm, count, period):
+        return True, 0
+
+
+class RateLimiter:
+    def __init__(self):
+        self.storage = NullStorage()
+        self.rules = {}
+
+    def init_app(self, app):
+        kind = app.config['RATELIMIT_STORAGE'] if app.config['RATELIMIT_ENABLED'] else 'null'
+        if kind == 'sqlite':
+            self.storage = SQLiteStorage(app.config['RATELIMIT_SQLITE_PATH'])
+        elif kind == 'memory':
+            self.storage = MemoryStorage()
+        else:
+            self.storage = NullStorage()
+        self.rules = {}
+        for name, rule in app.config['RATE_LIMITS'].items():
+            count, period = parse_limit(rule['limit'])
+            self.rules[name] = (count, period, rule.get('by', 'ip'), ALGORITHMS[rule.get('algorithm', 'token_bucket')])
+
+    def check(self, name):
+        rule = self.rules.get(name)
+        if rule is None:
+            return
+        count, period, by, algorithm = rule
+        identity = request.remote_addr or 'unknown'
+        if by == 'user' and session.get('_user_id'):
+            identity = f"user:{session['_user_id']}"
+        allowed, retry_after = self.storage.hit(f'{name}:{identity}', algorithm, count, period)
+        if not allowed:
+            current_app.logger.info('Rate limit %s exceeded by %s', name, identity)
+            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+
+
+limiter = RateLimiter()
+
+
+def rate_limited(name, methods=None):
+    """Apply the RATE_LIMITS rule `name` to a view; put it above login_required."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if methods is None or request.method in methods:
+                limiter.check(name)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
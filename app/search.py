@@ -0,0 +1,66 @@
+import re
+from sqlalchemy import text
+from . import db
+from .models import User
+
+# Queries against the tweet_fts and user_fts indexes (see migration 7). User input
+# is reduced to quoted terms, so FTS5 operators typed into the box are inert.
+
+TERM = re.compile(r'\w+', re.UNICODE)
+MAX_OFFSET = 1000
+
+TWEET_SEARCH = text('''
+SELECT rowid FROM tweet_fts WHERE tweet_fts MATCH :query
+ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset
+''')
+
+# Username hits outrank bio hits; popularity breaks ties
+USER_SEARCH = text('''
+SELECT user.id FROM user_fts JOIN user ON user.id = user_fts.rowid
+WHERE user_fts MATCH :query
+ORDER BY bm25(user_fts, 10.0, 1.0), user.follower_count DESC LIMIT :limit OFFSET :offset
+''')
+
+USERNAME_PREFIX = text('''
+SELECT user.id, user.username, user.profile_image FROM user_fts JOIN user ON user.id = user_fts.rowid
+WHERE user_fts MATCH :query
+ORDER BY user.follower_count DESC LIMIT :limit
+''')
+
+
+def match_expression(q, prefix_last=True):
+    terms = TERM.findall(q or '')
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if prefix_last:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _ids(statement, q, offset, limit):
+    query = match_expression(q)
+    if query is None or offset > MAX_OFFSET:
+        return [], False
+    rows = db.session.execute(statement, {'query': query, 'limit': limit + 1, 'offset': offset})
+    ids = [row[0] for row in rows]
+    return ids[:limit], len(ids) > limit
+
+
+def tweet_ids(q, offset=0, limit=20):
+    """Best-matching tweet ids and whether another page follows."""
+    return _ids(TWEET_SEARCH, q, offset, limit)
+
+
+def users(q, offset=0, limit=20):
+    ids, more = _ids(USER_SEARCH, q, offset, limit)
+    found = {user.id: user for user in User.query.filter(User.id.in_(ids))} if ids else {}
+    return [found[i] for i in ids if i in found], more
+
+
+def mention_candidates(prefix, limit=8):
+    terms = TERM.findall(prefix.lstrip('@'))
+    if len(terms) != 1:
+        return []
+    rows = db.session.execute(USERNAME_PREFIX, {'query': f'username: "{terms[0]}"*', 'limit': limit})
+    return [{'id': user_id, 'username': username, 'profile_image': image} for user_id, username, image in rows]
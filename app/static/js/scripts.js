@@ -121,7 +121,6 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Infinite scroll for tweets
     let isLoading = false;
-    let page = 1;
     const tweetsContainer = document.querySelector('.tweets-feed');
     const loadMoreTrigger = document.querySelector('.load-more-trigger');
 
@@ -137,19 +136,25 @@ document.addEventListener('DOMContentLoaded', function() {
         observer.observe(loadMoreTrigger);
 
         function loadMoreTweets() {
+            const cursor = loadMoreTrigger.dataset.nextCursor;
+            if (!cursor) {
+                return;
+            }
             isLoading = true;
-            page++;
 
-            fetch(`/api/tweets?page=${page}`)
+            fetch(`/api/feed?cursor=${encodeURIComponent(cursor)}`, {
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            })
                 .then(response => response.json())
                 .then(data => {
-                    if (data.tweets.length > 0) {
-                        data.tweets.forEach(tweet => {
-                            const tweetElement = createTweetElement(tweet);
-                            tweetsContainer.appendChild(tweetElement);
-                        });
+                    loadMoreTrigger.insertAdjacentHTML('beforebegin', data.html);
+                    if (data.next_cursor) {
+                        loadMoreTrigger.dataset.nextCursor = data.next_cursor;
                     } else {
-                        loadMoreTrigger.style.display = 'none';
+                        observer.disconnect();
+                        loadMoreTrigger.remove();
                     }
                     isLoading = false;
                 })
@@ -158,41 +163,6 @@ document.addEventListener('DOMContentLoaded', function() {
                     isLoading = false;
                 });
         }
-
-        function createTweetElement(tweet) {
-            const div = document.createElement('div');
-            div.className = 'card mb-3 tweet-card';
-            div.innerHTML = `
-                <div class="card-body">
-                    <div class="d-flex">
-                        <img src="/static/profile_pics/${tweet.author.profile_image}" class="rounded-circle me-3" width="50" height="50">
-                        <div class="flex-grow-1">
-                            <div class="d-flex justify-content-between">
-                                <h5 class="card-title mb-0">
-                                    <a href="/profile/${tweet.author.username}" class="text-decoration-none">${tweet.author.username}</a>
-                                </h5>
-                                <small class="text-muted">${new Date(tweet.created_at).toLocaleDateString()}</small>
-                            </div>
-                            <p class="card-text mt-2">${tweet.content}</p>
-                            ${tweet.image ? `<img src="/static/tweets/${tweet.image}" class="img-fluid rounded mb-2 tweet-image">` : ''}
-                            <div class="d-flex justify-content-between mt-3">
-                                <div class="tweet-actions">
-                                    <a href="/like/${tweet.id}" class="text-decoration-none text-muted me-3" data-action="like" data-tweet-id="${tweet.id}">
-                                        <i class="fas fa-heart ${tweet.has_liked ? 'text-danger' : ''}"></i>
-                                        <span>${tweet.likes_count}</span>
-                                    </a>
-                                    <a href="/retweet/${tweet.id}" class="text-decoration-none text-muted" data-action="retweet" data-tweet-id="${tweet.id}">
-                                        <i class="fas fa-retweet ${tweet.has_retweeted ? 'text-success' : ''}"></i>
-                                        <span>${tweet.retweets_count}</span>
-                                    </a>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            `;
-            return div;
-        }
     }
 
     // Tweet template
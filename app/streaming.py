@@ -0,0 +1,148 @@
+import heapq
+import json
+from itertools import islice
+from flask import Response, stream_with_context
+from . import db
+from .archive import archive
+from .feed import _viewer_set
+from .models import User, Tweet, Retweet, Like
+
+# Bulk tweet export for /api/v2: rows come off a server-side cursor in chunks
+# and are serialized as they arrive, so memory stays flat however long the range.
+# Archived tweets are merged in by id from the yearly partitions.
+
+COLUMNS = {
+    'id': Tweet.id,
+    'content': Tweet.content,
+    'image': Tweet.image,
+    'user_id': Tweet.user_id,
+    'username': User.username,
+    'created_at': Tweet.created_at,
+    'likes': Tweet.like_count,
+    'retweets': Tweet.retweet_count,
+}
+VIEWER_FIELDS = {'liked': Like, 'retweeted': Retweet}
+FIELDS = tuple(COLUMNS) + tuple(VIEWER_FIELDS)
+CHUNK_SIZE = 500
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class InvalidFormat(ValueError):
+    pass
+
+
+def parse_fields(value):
+    if not value:
+        return FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown or not fields:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Choose from {', '.join(FIELDS)}.")
+    return fields
+
+
+def tweet_rows(authors, fields, since_id=None, max_id=None, limit=None, viewer=None):
+    """Yield dicts for tweets by authors (ids, or a select of ids), newest first, CHUNK_SIZE rows per query round-trip."""
+    columns = [Tweet.id] + [COLUMNS[f] for f in fields if f in COLUMNS and f != 'id']
+    query = db.session.query(*columns).filter(Tweet.user_id.in_(authors))
+    if 'username' in fields:
+        query = query.join(User, User.id == Tweet.user_id)
+    if since_id:
+        query = query.filter(Tweet.id > since_id)
+    if max_id:
+        query = query.filter(Tweet.id <= max_id)
+    query = query.order_by(Tweet.id.desc())
+    if limit:
+        query = query.limit(limit)
+    names = ['id'] + [f for f in fields if f in COLUMNS and f != 'id']
+    flags = [(f, VIEWER_FIELDS[f]) for f in fields if f in VIEWER_FIELDS]
+    rows = (dict(zip(names, row)) for row in query.yield_per(CHUNK_SIZE))
+    if archive.years():
+        if not isinstance(authors, (list, tuple, set)):
+            authors = db.session.execute(authors).scalars().all()
+        older = _archived(archive.by_id(authors, since_id, max_id, limit), names)
+        rows = heapq.merge(rows, older, key=lambda values: values['id'], reverse=True)
+        if limit:
+            rows = islice(rows, limit)
+    chunk = []
+    for values in rows:
+        chunk.append(values)
+        if len(chunk) == CHUNK_SIZE:
+            yield from _rows(chunk, fields, flags, viewer)
+            chunk = []
+    yield from _rows(chunk, fields, flags, viewer)
+
+
+def _archived(rows, names):
+    # Archive rows carry frozen counts but no username, which lives in the hot user table
+    for chunk in iter(lambda: list(islice(rows, CHUNK_SIZE)), []):
+        usernames = {}
+        if 'username' in names:
+            usernames = dict(db.session.query(User.id, User.username).filter(
+                User.id.in_({row.user_id for row in chunk})))
+        for row in chunk:
+            values = {'id': row.id, 'content': row.content, 'image': row.image, 'user_id': row.user_id,
+                      'username': usernames.get(row.user_id), 'created_at': row.created_at,
+                      'likes': row.like_count, 'retweets': row.retweet_count}
+            yield {name: values[name] for name in names}
+
+
+def _rows(chunk, fields, flags, viewer):
+    if not chunk:
+        return
+    ids = [values['id'] for values in chunk]
+    sets = {f: _viewer_set(model, viewer, ids) if viewer else set() for f, model in flags}
+    for values in chunk:
+        for f, _ in flags:
+            values[f] = values['id'] in sets[f]
+        if 'created_at' in values:
+            values['created_at'] = values['created_at'].isoformat()
+        yield {f: values[f] for f in fields}
+
+
+def _ndjson(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, separators=(',', ':')))
+        if len(lines) == CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _json_array(rows):
+    # Output matches json.dumps(list(rows)) without ever holding the list
+    yield '['
+    separator = ''
+    buffer = []
+    for row in rows:
+        buffer.append(separator + json.dumps(row, separators=(',', ':')))
+        separator = ','
+        if len(buffer) == CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    yield ''.join(buffer) + ']'
+
+
+FORMATS = {
+    'ndjson': (_ndjson, 'application/x-ndjson'),
+    'json': (_json_array, 'application/json'),
+}
+
+
+def parse_format(value):
+    if value not in FORMATS:
+        raise InvalidFormat(f"Unknown format: {value}. Choose from {', '.join(FORMATS)}.")
+    return value
+
+
+def stream_response(rows, fmt='ndjson'):
+    encode, mimetype = FORMATS[parse_format(fmt)]
+    response = Response(stream_with_context(encode(rows)), mimetype=mimetype)
+    # Let proxies pass chunks through instead of buffering the whole body
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
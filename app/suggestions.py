@@ -0,0 +1,148 @@
+from flask import current_app
+from sqlalchemy import exists, text
+from . import db, events
+from .jobs import jobs
+from .models import Suggestion, User, followers
+
+# "Who to follow" from friends-of-friends: suggestion(user, candidate).score is the
+# number of people the user follows who follow the candidate. Follow edges adjust
+# scores incrementally in the background; rebuild() recomputes a user from scratch.
+
+REBUILD = text('''
+INSERT INTO suggestion (user_id, candidate_id, score)
+SELECT :user_id, f2.followed_id, count(*) AS score
+FROM followers f1 JOIN followers f2 ON f2.follower_id = f1.followed_id
+WHERE f1.follower_id = :user_id
+  AND f2.followed_id != :user_id
+  AND f2.followed_id NOT IN (SELECT followed_id FROM followers WHERE follower_id = :user_id)
+GROUP BY f2.followed_id
+ORDER BY score DESC
+LIMIT :limit
+''')
+
+# Everyone the actor follows now has one more mutual link to the candidate
+ADD_VIA = text('''
+INSERT INTO suggestion (user_id, candidate_id, score)
+SELECT :user_id, followed_id, 1 FROM followers
+WHERE follower_id = :via AND followed_id != :user_id
+  AND followed_id NOT IN (SELECT followed_id FROM followers WHERE follower_id = :user_id)
+ON CONFLICT (user_id, candidate_id) DO UPDATE SET score = score + 1
+''')
+
+ADD_TO_FOLLOWERS = text('''
+INSERT INTO suggestion (user_id, candidate_id, score)
+SELECT follower_id, :candidate_id, 1 FROM followers
+WHERE followed_id = :via AND follower_id != :candidate_id
+  AND follower_id NOT IN (SELECT follower_id FROM followers WHERE followed_id = :candidate_id)
+ON CONFLICT (user_id, candidate_id) DO UPDATE SET score = score + 1
+''')
+
+REMOVE_VIA = text('''
+UPDATE suggestion SET score = score - 1
+WHERE user_id = :user_id
+  AND candidate_id IN (SELECT followed_id FROM followers WHERE follower_id = :via)
+''')
+
+REMOVE_FROM_FOLLOWERS = text('''
+UPDATE suggestion SET score = score - 1
+WHERE candidate_id = :candidate_id
+  AND user_id IN (SELECT follower_id FROM followers WHERE followed_id = :via)
+''')
+
+# Rows that fell to zero when the follower or the followers of :via lost a link
+FORGET_ZEROED = text('''
+DELETE FROM suggestion WHERE score <= 0 AND (
+    user_id = :user_id
+    OR (candidate_id = :candidate_id
+        AND user_id IN (SELECT follower_id FROM followers WHERE followed_id = :user_id))
+)
+''')
+
+# Scores only grow for the follower and the people following them; both keep
+# their top SUGGESTIONS_PER_USER, like rebuild()
+TRIM_USER = text('''
+DELETE FROM suggestion WHERE user_id = :user_id AND candidate_id NOT IN (
+    SELECT candidate_id FROM suggestion WHERE user_id = :user_id
+    ORDER BY score DESC, candidate_id LIMIT :limit
+)
+''')
+
+TRIM_FOLLOWERS = text('''
+DELETE FROM suggestion WHERE (user_id, candidate_id) IN (
+    SELECT user_id, candidate_id FROM (
+        SELECT user_id, candidate_id,
+               row_number() OVER (PARTITION BY user_id ORDER BY score DESC, candidate_id) AS rank
+        FROM suggestion
+        WHERE user_id IN (SELECT follower_id FROM followers WHERE followed_id = :user_id)
+    ) WHERE rank > :limit
+)
+''')
+
+suggestions = Suggestion.__table__
+
+
+def rebuild(user_id):
+    db.session.execute(suggestions.delete().where(suggestions.c.user_id == user_id))
+    db.session.execute(REBUILD, {'user_id': user_id, 'limit': current_app.config['SUGGESTIONS_PER_USER']})
+    db.session.commit()
+
+
+def apply_follow(follower_id, followed_id):
+    db.session.execute(suggestions.delete().where(
+        suggestions.c.user_id == follower_id,
+        suggestions.c.candidate_id == followed_id
+    ))
+    db.session.execute(ADD_VIA, {'user_id': follower_id, 'via': followed_id})
+    db.session.execute(ADD_TO_FOLLOWERS, {'candidate_id': followed_id, 'via': follower_id})
+    trim = {'user_id': follower_id, 'limit': current_app.config['SUGGESTIONS_PER_USER']}
+    db.session.execute(TRIM_USER, trim)
+    db.session.execute(TRIM_FOLLOWERS, trim)
+    db.session.commit()
+
+
+def apply_unfollow(follower_id, followed_id):
+    db.session.execute(REMOVE_VIA, {'user_id': follower_id, 'via': followed_id})
+    db.session.execute(REMOVE_FROM_FOLLOWERS, {'candidate_id': followed_id, 'via': follower_id})
+    db.session.execute(FORGET_ZEROED, {'user_id': follower_id, 'candidate_id': followed_id})
+    # The unfollowed user may still be reachable through someone else
+    db.session.execute(text('''
+    INSERT OR REPLACE INTO suggestion (user_id, candidate_id, score)
+    SELECT :user_id, :candidate_id, count(*) FROM followers f1
+    JOIN followers f2 ON f2.follower_id = f1.followed_id AND f2.followed_id = :candidate_id
+    WHERE f1.follower_id = :user_id
+    HAVING count(*) > 0
+    '''), {'user_id': follower_id, 'candidate_id': followed_id})
+    db.session.execute(TRIM_USER, {'user_id': follower_id, 'limit': current_app.config['SUGGESTIONS_PER_USER']})
+    db.session.commit()
+
+
+def init_app(app):
+    events.subscribe('user_followed')(_followed)
+    events.subscribe('user_unfollowed')(_unfollowed)
+
+
+def _followed(name, follower_id, followed_id):
+    jobs.submit(apply_follow, follower_id, followed_id)
+
+
+def _unfollowed(name, follower_id, followed_id):
+    jobs.submit(apply_unfollow, follower_id, followed_id)
+
+
+def for_user(user, limit=5, exclude=()):
+    excluded = {user.id, *exclude}
+    ids = db.session.query(Suggestion.candidate_id).filter(
+        Suggestion.user_id == user.id,
+        Suggestion.candidate_id.notin_(excluded)
+    ).order_by(Suggestion.score.desc()).limit(limit).all()
+    ids = [candidate_id for candidate_id, in ids]
+    users = {u.id: u for u in User.query.filter(User.id.in_(ids))} if ids else {}
+    picked = [users[i] for i in ids if i in users]
+    if len(picked) < limit:
+        # New or isolated users have no friends-of-friends yet: fall back to popular accounts
+        excluded.update(ids)
+        followed = exists().where(db.and_(followers.c.follower_id == user.id, followers.c.followed_id == User.id))
+        picked += User.query.filter(
+            User.id.notin_(excluded), ~followed
+        ).order_by(User.follower_count.desc()).limit(limit - len(picked)).all()
+    return picked
@@ -0,0 +1,193 @@
+import heapq
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import and_, func, insert, literal, or_, select, union_all
+from . import db, events
+from .jobs import jobs
+from .models import Retweet, TimelineEntry, Tweet, User, followers
+from .pagination import Page, decode_cursor, encode_cursor, page_size
+
+timeline = TimelineEntry.__table__
+COLUMNS = ['user_id', 'tweet_id', 'author_id', 'created_at']
+
+
+def _max_length():
+    return current_app.config['TIMELINE_MAX_LENGTH']
+
+
+def _insert_ignore(rows):
+    return insert(timeline).prefix_with('OR IGNORE').from_select(COLUMNS, rows)
+
+
+def fan_out(tweet):
+    # Push a freshly flushed tweet onto the author's and every follower's timeline
+    values = [literal(tweet.id), literal(tweet.user_id), literal(tweet.created_at)]
+    own = select(literal(tweet.user_id), *values)
+    fans = select(followers.c.follower_id, *values).where(followers.c.followed_id == tweet.user_id)
+    db.session.execute(_insert_ignore(union_all(own, fans)))
+
+
+def backfill(user_id, followed_id):
+    # Copy the newest tweets of a freshly followed user into the follower's timeline
+    recent = select(literal(user_id), Tweet.id, Tweet.user_id, Tweet.created_at).where(
+        Tweet.user_id == followed_id
+    ).order_by(Tweet.created_at.desc()).limit(_max_length())
+    db.session.execute(_insert_ignore(recent))
+    trim(user_id)
+
+
+def prune(user_id, unfollowed_id):
+    db.session.execute(timeline.delete().where(
+        timeline.c.user_id == user_id,
+        timeline.c.author_id == unfollowed_id
+    ))
+
+
+def trim(user_id):
+    cutoff = select(timeline.c.created_at).where(
+        timeline.c.user_id == user_id
+    ).order_by(timeline.c.created_at.desc()).offset(_max_length() - 1).limit(1).scalar_subquery()
+    db.session.execute(timeline.delete().where(
+        timeline.c.user_id == user_id,
+        timeline.c.created_at < cutoff
+    ))
+
+
+def trim_overflowing(user_ids):
+    # Timelines are allowed to grow a little past the limit so trimming stays rare
+    limit = _max_length() + current_app.config['TIMELINE_TRIM_SLACK']
+    overflowing = db.session.execute(
+        select(timeline.c.user_id).where(timeline.c.user_id.in_(user_ids))
+        .group_by(timeline.c.user_id).having(func.count() > limit)
+    ).scalars().all()
+    for user_id in overflowing:
+        trim(user_id)
+
+
+def trim_audience(author_id):
+    # Counting every follower's timeline is too slow for the publishing request; runs as a job
+    trim_overflowing(select(literal(author_id)).union(
+        select(followers.c.follower_id).where(followers.c.followed_id == author_id)))
+    db.session.commit()
+
+
+@events.subscribe('tweet_created')
+def _tweet_created(name, tweet_id, author_id):
+    jobs.submit(trim_audience, author_id)
+
+
+def rebuild(user):
+    db.session.execute(timeline.delete().where(timeline.c.user_id == user.id))
+    authors = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    recent = select(literal(user.id), Tweet.id, Tweet.user_id, Tweet.created_at).where(
+        (Tweet.user_id == user.id) | Tweet.user_id.in_(authors)
+    ).order_by(Tweet.created_at.desc()).limit(_max_length())
+    db.session.execute(_insert_ignore(recent))
+
+
+# Home page = two pre-sorted streams merged by time: original tweets from the
+# materialized timeline, and retweets by the reader and the accounts they
+# follow. Each stream reads one index range. A tweet is shown once, at its
+# newest retweet if anyone the reader follows retweeted it ("A and 3 others"),
+# otherwise as the original; earlier events for it are skipped on every page.
+
+Event = namedtuple('Event', ['created_at', 'id', 'retweeter_id'])
+TimelineItem = namedtuple('TimelineItem', ['id', 'created_at', 'retweeted_by', 'retweeters'])
+
+
+def _before(created_col, id_col, position):
+    created_at, item_id = position
+    return or_(created_col < created_at, and_(created_col == created_at, id_col < item_id))
+
+
+def _at_or_after(created_col, id_col, position):
+    created_at, item_id = position
+    return or_(created_col > created_at, and_(created_col == created_at, id_col >= item_id))
+
+
+def _originals(user_id, position, limit):
+    query = db.session.query(TimelineEntry.created_at, TimelineEntry.tweet_id, literal(None)).filter(
+        TimelineEntry.user_id == user_id
+    )
+    if position:
+        query = query.filter(_before(TimelineEntry.created_at, TimelineEntry.tweet_id, position))
+    return [Event(*row) for row in query.order_by(
+        TimelineEntry.created_at.desc(), TimelineEntry.tweet_id.desc()
+    ).limit(limit)]
+
+
+def _sources(user_id):
+    return or_(Retweet.user_id == user_id, Retweet.user_id.in_(
+        select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    ))
+
+
+def _retweets(user_id, position, floor, limit):
+    query = db.session.query(Retweet.created_at, Retweet.tweet_id, Retweet.user_id).filter(_sources(user_id))
+    # The plain created_at bounds let each followee's index range stop early
+    if position:
+        query = query.filter(Retweet.created_at <= position[0],
+                             _before(Retweet.created_at, Retweet.tweet_id, position))
+    if floor:
+        # Older than the originals stream reaches on this page: left for the next one
+        query = query.filter(Retweet.created_at >= floor[0],
+                             _at_or_after(Retweet.created_at, Retweet.tweet_id, floor))
+    return [Event(*row) for row in query.order_by(
+        Retweet.created_at.desc(), Retweet.tweet_id.desc()
+    ).limit(limit)]
+
+
+def _retweet_summary(user_id, tweet_ids):
+    # SQLite fills the bare columns from the row holding max(created_at): the newest retweeter
+    rows = db.session.query(
+        Retweet.tweet_id, func.max(Retweet.created_at), func.count(), Retweet.user_id, User.username
+    ).join(User, User.id == Retweet.user_id).filter(
+        Retweet.tweet_id.in_(tweet_ids), _sources(user_id)
+    ).group_by(Retweet.tweet_id)
+    return {tweet_id: (newest, count, retweeter_id, username)
+            for tweet_id, newest, count, retweeter_id, username in rows}
+
+
+def _batch(user_id, position, limit, items, seen):
+    # Appends canonical events below position to items; returns where it stopped, or None at the end
+    originals = _originals(user_id, position, limit + 1)
+    floor = originals[-1][:2] if len(originals) > limit else None
+    retweets = _retweets(user_id, position, floor, limit + 1)
+    if len(retweets) > limit:
+        floor = max(floor, retweets[-1][:2]) if floor else retweets[-1][:2]
+    merged = heapq.merge(originals, retweets, key=lambda event: event[:2], reverse=True)
+    events = [event for event in merged if floor is None or event[:2] > floor]
+    summary = _retweet_summary(user_id, {event.id for event in events}) if events else {}
+    consumed = 0
+    for event in events:
+        if len(items) == limit:
+            break
+        consumed += 1
+        retweeted = summary.get(event.id)
+        if event.retweeter_id is None:
+            canonical = retweeted is None
+        else:
+            canonical = (event.created_at, event.retweeter_id) == (retweeted[0], retweeted[2])
+        if event.id in seen or not canonical:
+            continue
+        seen.add(event.id)
+        if retweeted is None:
+            items.append(TimelineItem(event.id, event.created_at, None, 0))
+        else:
+            items.append(TimelineItem(event.id, event.created_at, retweeted[3], retweeted[1]))
+    if consumed and (floor is not None or consumed < len(events)):
+        return events[consumed - 1][:2]
+    return None
+
+
+def home_page(user, cursor=None, limit=None):
+    """Tweet ids with retweet attribution; callers hydrate them with feed.hydrate_page()."""
+    limit = limit or page_size()
+    position = decode_cursor(cursor) if cursor else None
+    items, seen = [], set()
+    # Skipped duplicates can leave a batch short; top it up a few times
+    for _ in range(3):
+        position = _batch(user.id, position, limit, items, seen)
+        if position is None or len(items) == limit:
+            break
+    return Page(items, encode_cursor(*position) if position else None)
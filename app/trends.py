@@ -0,0 +1,82 @@
+import heapq
+import time
+from collections import defaultdict
+from datetime import timezone
+from flask import current_app
+from sqlalchemy import text
+from . import db
+from .cache import cache
+from .models import Hashtag, TrendBucket
+
+# Trending hashtags: each use bumps a counter in a TRENDS_BUCKET_SECONDS-wide
+# bucket. A tag's score is the sum of its buckets inside TRENDS_WINDOW, each
+# halved every TRENDS_HALF_LIFE, and the top-K list is computed at most once
+# per TRENDS_REFRESH and served from the cache.
+
+UPSERT = text('''
+INSERT INTO trend_bucket (hashtag_id, bucket, count) VALUES (:hashtag_id, :bucket, :delta)
+ON CONFLICT (hashtag_id, bucket) DO UPDATE SET count = count + :delta
+''')
+
+
+def bucket_of(timestamp):
+    return int(timestamp) // current_app.config['TRENDS_BUCKET_SECONDS']
+
+
+def _window_start(now_bucket):
+    config = current_app.config
+    return now_bucket - config['TRENDS_WINDOW'] // config['TRENDS_BUCKET_SECONDS']
+
+
+def record(hashtag_ids, created_at, delta=1, connection=None):
+    connection = connection or db.session
+    bucket = bucket_of(created_at.replace(tzinfo=timezone.utc).timestamp())
+    oldest = _window_start(bucket_of(time.time()))
+    if bucket < oldest:
+        return
+    connection.execute(UPSERT, [{'hashtag_id': hashtag_id, 'bucket': bucket, 'delta': delta}
+                                for hashtag_id in hashtag_ids])
+    # Buckets that slid out of the window are never read again
+    connection.execute(TrendBucket.__table__.delete().where(
+        db.or_(TrendBucket.bucket < oldest, TrendBucket.count <= 0)
+    ))
+
+
+def compute(k):
+    config = current_app.config
+    now = bucket_of(time.time())
+    decay = 0.5 ** (config['TRENDS_BUCKET_SECONDS'] / config['TRENDS_HALF_LIFE'])
+    scores = defaultdict(float)
+    totals = defaultdict(int)
+    rows = db.session.query(TrendBucket.hashtag_id, TrendBucket.bucket, TrendBucket.count).filter(
+        TrendBucket.bucket >= _window_start(now)
+    )
+    for hashtag_id, bucket, count in rows:
+        scores[hashtag_id] += count * decay ** max(now - bucket, 0)
+        totals[hashtag_id] += count
+    top = heapq.nlargest(k, ((score, hashtag_id) for hashtag_id, score in scores.items() if score > 0))
+    names = dict(db.session.query(Hashtag.id, Hashtag.name).filter(Hashtag.id.in_([h for _, h in top]))) if top else {}
+    return [{'name': names[hashtag_id], 'score': round(score, 3), 'tweets': totals[hashtag_id]}
+            for score, hashtag_id in top if hashtag_id in names]
+
+
+def top(k=None):
+    config = current_app.config
+    k = min(k or config['TRENDS_TOP_K'], config['TRENDS_TOP_K'])
+    trending = cache.get_or_set('trends', lambda: compute(config['TRENDS_TOP_K']), config['TRENDS_REFRESH'])
+    return trending[:k]
+
+
+def rebuild():
+    """Recount the buckets inside the window from tweet_hashtag."""
+    config = current_app.config
+    oldest = _window_start(bucket_of(time.time()))
+    db.session.execute(TrendBucket.__table__.delete())
+    db.session.execute(text('''
+    INSERT INTO trend_bucket (hashtag_id, bucket, count)
+    SELECT hashtag_id, CAST(strftime('%s', created_at) AS INTEGER) / :width AS bucket, count(*)
+    FROM tweet_hashtag
+    WHERE CAST(strftime('%s', created_at) AS INTEGER) / :width >= :oldest
+    GROUP BY hashtag_id, bucket
+    '''), {'width': config['TRENDS_BUCKET_SECONDS'], 'oldest': oldest})
+    db.session.commit()
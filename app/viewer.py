@@ -0,0 +1,41 @@
+from sqlalchemy.orm import make_transient_to_detached
+from . import db
+from .cache import LRUCache, cache
+from .models import User
+
+# Logged-in user rows (counters included), kept in a per-worker LRU so
+# authenticated requests start without a user query; who they follow comes
+# from follow_graph. Entries are keyed by the user:<id> version stamp, which is
+# bumped on profile edits, follow changes and new tweets (see cache.py); the
+# TTL bounds how long another worker can serve a row it never saw invalidated.
+# Kept out of the shared cache backend because the row carries the password hash.
+
+COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+
+class ViewerCache:
+    def __init__(self):
+        self.contexts = LRUCache()
+
+    def init_app(self, app):
+        self.contexts = LRUCache(app.config['VIEWER_CACHE_SIZE'], app.config['VIEWER_CACHE_TTL'])
+
+    def _build(self, user_id):
+        row = db.session.query(*User.__table__.columns).filter(User.id == user_id).first()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def load(self, user_id):
+        """The user attached to the current session, without a query on a cache hit."""
+        key = f"viewer:{user_id}:{cache.version(f'user:{user_id}')}"
+        values = self.contexts.get(key)
+        if values is None:
+            values = self._build(user_id)
+            if values is None:
+                return None
+            self.contexts.set(key, values)
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+viewers = ViewerCache()
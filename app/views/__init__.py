@@ -0,0 +1,43 @@
+from flask import jsonify, redirect, request
+from flask_wtf.csrf import generate_csrf
+from werkzeug.exceptions import TooManyRequests
+from ..pagination import InvalidCursor
+from . import api, auth, main, media
+
+# Routes are grouped into blueprints, one module each, without URL prefixes
+# except /api. They are registered eagerly: url_for() needs every endpoint in
+# the URL map from the first request, and Flask expects all routes to be set
+# up before the app serves one. The import cost is paid once in the gunicorn
+# master when preload_app is on (see app/warmup.py).
+
+BLUEPRINTS = (auth.bp, main.bp, api.bp, media.bp)
+
+
+def init_app(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+    app.register_error_handler(TooManyRequests, too_many_requests)
+    app.register_error_handler(InvalidCursor, invalid_cursor)
+    app.after_request(set_csrf_cookie)
+
+
+def too_many_requests(error):
+    if request.path.startswith('/api/') or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = jsonify({'success': False, 'error': 'Too many requests', 'retry_after': error.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+    return error
+
+
+def invalid_cursor(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return redirect(request.path)
+
+
+# Add CSRF token to all responses
+def set_csrf_cookie(response):
+    if 'text/html' in response.headers.get('Content-Type', ''):
+        response.set_cookie('csrf_token', generate_csrf())
+    return response
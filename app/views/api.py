@@ -0,0 +1,239 @@
+from flask import Blueprint, render_template, request, jsonify, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import literal, select
+from .. import archive, db, feed, notifications, search, streaming, timeline, trends
+from ..cache import cache
+from ..database import read_only
+from ..engagement import engagement, LIKE, RETWEET, FOLLOW
+from ..models import User, Tweet, Mention, followers
+from ..pagination import page_size, paginate
+from ..ratelimit import rate_limited
+from .common import publish_tweet, run_search
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+@bp.route('/tweets', methods=['GET'])
+@read_only
+def get_tweets():
+    viewer = current_user if current_user.is_authenticated else None
+    cursor = request.args.get('cursor')
+    limit = page_size()
+
+    # Which tweets a page holds changes only when tweets are written or deleted;
+    # their counts and the viewer's likes change with each tweet's own stamp
+    def build_page():
+        page = archive.tweet_page(cursor=cursor, limit=limit)
+        return [row.id for row in page.items], page.next_cursor
+
+    ids, next_cursor = cache.get_or_set(f"api_tweet_ids:{cache.version('tweets')}:{cursor}:{limit}",
+                                        build_page, current_app.config['CACHE_API_TTL'])
+
+    def build_payload():
+        return {
+            'tweets': [item.as_json() for item in feed.hydrate(ids, viewer)],
+            'next_cursor': next_cursor
+        }
+
+    stamp = cache.versions(f'tweet:{tweet_id}' for tweet_id in ids)
+    key = f"api_tweets:{cache.version('tweets')}:{stamp}:{viewer.id if viewer else 0}:{cursor}:{limit}"
+    return jsonify(cache.get_or_set(key, build_payload, current_app.config['CACHE_API_TTL']))
+
+
+# Next page of the home timeline as rendered cards, for infinite scroll
+@bp.route('/feed', methods=['GET'])
+@login_required
+@read_only
+def feed_page():
+    page = feed.hydrate_page(timeline.home_page(current_user, request.args.get('cursor')), current_user)
+    return jsonify({
+        'html': render_template('_tweet_feed.html', tweets=page.items),
+        'next_cursor': page.next_cursor
+    })
+
+
+def stream_tweets(authors, viewer):
+    try:
+        fields = streaming.parse_fields(request.args.get('fields'))
+        fmt = streaming.parse_format(request.args.get('format', 'ndjson'))
+    except (streaming.InvalidFields, streaming.InvalidFormat) as e:
+        return jsonify({'error': str(e)}), 400
+    rows = streaming.tweet_rows(
+        authors, fields,
+        since_id=request.args.get('since_id', type=int),
+        max_id=request.args.get('max_id', type=int),
+        limit=request.args.get('limit', type=int),
+        viewer=viewer
+    )
+    return streaming.stream_response(rows, fmt)
+
+
+# Streams the whole home timeline (not just the materialized window) for sync clients
+@bp.route('/v2/timeline', methods=['GET'])
+@login_required
+@read_only
+def api_timeline():
+    authors = select(literal(current_user.id)).union(
+        select(followers.c.followed_id).where(followers.c.follower_id == current_user.id))
+    return stream_tweets(authors, current_user)
+
+
+@bp.route('/v2/users/<int:user_id>/tweets', methods=['GET'])
+@read_only
+def api_user_tweets(user_id):
+    user = User.query.get_or_404(user_id)
+    viewer = current_user if current_user.is_authenticated else None
+    return stream_tweets([user.id], viewer)
+
+
+@bp.route('/search')
+@read_only
+def api_search():
+    q, kind, results, next_page = run_search()
+    if kind == 'users':
+        results = [{'id': u.id, 'username': u.username, 'bio': u.bio, 'profile_image': u.profile_image,
+                    'followers': u.follower_count} for u in results]
+    else:
+        results = [item.as_json() for item in results]
+    return jsonify({kind: results, 'next_page': next_page})
+
+
+@bp.route('/trends')
+@read_only
+def api_trends():
+    return jsonify({'trends': trends.top(request.args.get('limit', type=int))})
+
+
+@bp.route('/mentions')
+@login_required
+@read_only
+def api_mentions():
+    page = feed.hydrate_page(paginate(
+        db.session.query(Mention.tweet_id.label('id'), Mention.created_at).filter(
+            Mention.user_id == current_user.id
+        ),
+        Mention.created_at, Mention.tweet_id, request.args.get('cursor')
+    ), current_user)
+    return jsonify({'tweets': [item.as_json() for item in page.items], 'next_cursor': page.next_cursor})
+
+
+@bp.route('/notifications', methods=['GET'])
+@login_required
+@read_only
+def api_notifications():
+    page = notifications.page(current_user.id, request.args.get('cursor'))
+    return jsonify({
+        'notifications': [item.as_json() for item in page.items],
+        'next_cursor': page.next_cursor,
+        'unread': notifications.unread_count(current_user.id)
+    })
+
+
+# Cheap enough to poll: one cached counter, no notification rows
+@bp.route('/notifications/unread_count', methods=['GET'])
+@login_required
+def api_unread_notifications():
+    return jsonify({'unread': notifications.unread_count(current_user.id)})
+
+
+@bp.route('/notifications/read', methods=['POST'])
+@login_required
+def api_mark_notifications_read():
+    notifications.mark_read(current_user.id)
+    return jsonify({'success': True, 'unread': 0})
+
+
+# Username completion for @mentions in the tweet box
+@bp.route('/users/autocomplete')
+@read_only
+def autocomplete_users():
+    return jsonify({'users': search.mention_candidates(request.args.get('q', ''))})
+
+
+# Rendered cards for tweets announced over /stream
+@bp.route('/cards', methods=['GET'])
+@login_required
+@read_only
+def feed_cards():
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.isdigit()][:current_app.config['FEED_MAX_PAGE_SIZE']]
+    items = sorted(feed.hydrate(ids, current_user), key=lambda item: (item.created_at, item.id), reverse=True)
+    return jsonify({'html': render_template('_tweet_feed.html', tweets=items)})
+
+
+@bp.route('/tweets', methods=['POST'])
+@rate_limited('tweet')
+@login_required
+def create_tweet():
+    data = request.json
+    if not data or 'content' not in data:
+        return jsonify({'error': 'Content is required'}), 400
+    tweet = Tweet(content=data['content'], user_id=current_user.id)
+    publish_tweet(tweet)
+    return jsonify({
+        'id': tweet.id,
+        'content': tweet.content,
+        'user_id': tweet.user_id,
+        'username': current_user.username,
+        'created_at': tweet.created_at.isoformat()
+    }), 201
+
+
+@bp.route('/tweets/<int:tweet_id>/like', methods=['POST'])
+@rate_limited('engagement')
+@login_required
+def api_like_tweet(tweet_id):
+    tweet = Tweet.query.get_or_404(tweet_id)
+    if engagement.toggle(LIKE, current_user.id, tweet.id):
+        return jsonify({'message': 'Tweet liked'})
+    return jsonify({'message': 'Tweet unliked'})
+
+
+@bp.route('/tweets/<int:tweet_id>/retweet', methods=['POST'])
+@rate_limited('engagement')
+@login_required
+def api_retweet(tweet_id):
+    tweet = Tweet.query.get_or_404(tweet_id)
+    if tweet.user_id == current_user.id:
+        return jsonify({'error': 'You cannot retweet your own tweet'}), 400
+    if engagement.toggle(RETWEET, current_user.id, tweet.id):
+        return jsonify({'message': 'Tweet retweeted'})
+    return jsonify({'message': 'Retweet removed'})
+
+
+@bp.route('/like/<int:tweet_id>', methods=['POST'])
+@rate_limited('engagement')
+@login_required
+def like_tweet(tweet_id):
+    try:
+        tweet = Tweet.query.get_or_404(tweet_id)
+        action = 'liked' if engagement.toggle(LIKE, current_user.id, tweet.id) else 'unliked'
+        likes_count = tweet.like_count + engagement.delta(LIKE, tweet.id)
+        return jsonify({'success': True, 'likes_count': likes_count, 'action': action})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@bp.route('/retweet/<int:tweet_id>', methods=['POST'])
+@rate_limited('engagement')
+@login_required
+def retweet_tweet(tweet_id):
+    try:
+        tweet = Tweet.query.get_or_404(tweet_id)
+        action = 'retweeted' if engagement.toggle(RETWEET, current_user.id, tweet.id) else 'unretweeted'
+        retweets_count = tweet.retweet_count + engagement.delta(RETWEET, tweet.id)
+        return jsonify({'success': True, 'retweets_count': retweets_count, 'action': action})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@bp.route('/follow/<int:user_id>', methods=['POST'])
+@rate_limited('engagement')
+@login_required
+def follow_user(user_id):
+    user = User.query.get_or_404(user_id)
+    if user == current_user:
+        return jsonify({'success': False, 'message': 'You cannot follow yourself'}), 400
+    following = engagement.toggle(FOLLOW, current_user.id, user.id)
+    return jsonify({'success': True, 'following': following})
@@ -0,0 +1,67 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask_login import login_user, logout_user, login_required, current_user
+from .. import db, purge
+from ..forms import LoginForm, RegistrationForm, DeleteAccountForm
+from ..jobs import jobs
+from ..models import User
+from ..ratelimit import rate_limited
+
+bp = Blueprint('auth', __name__)
+
+
+@bp.route('/login', methods=['GET', 'POST'])
+@rate_limited('login', methods=('POST',))
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        if user and user.check_password(form.password.data):
+            db.session.commit()
+            login_user(user)
+            next_page = request.args.get('next')
+            return redirect(next_page or url_for('main.dashboard'))
+        else:
+            flash('Login Unsuccessful. Please check email and password', 'danger')
+    return render_template('login.html', form=form)
+
+
+@bp.route('/signup', methods=['GET', 'POST'])
+@rate_limited('signup', methods=('POST',))
+def signup():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        user = User(username=form.username.data, email=form.email.data)
+        user.set_password(form.password.data)
+        db.session.add(user)
+        db.session.commit()
+        flash('Your account has been created! You can now log in.', 'success')
+        return redirect(url_for('auth.login'))
+    return render_template('signup.html', form=form)
+
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('main.home'))
+
+
+@bp.route('/delete_account', methods=['POST'])
+@login_required
+def delete_account():
+    form = DeleteAccountForm()
+    if not form.validate_on_submit() or not current_user.check_password(form.password.data):
+        flash('Incorrect password; your account was not deleted.', 'danger')
+        return redirect(url_for('main.edit_profile'))
+    # Signed out and locked at once; the rows go in the background, chunk by chunk
+    user_id = current_user.id
+    current_user.password_hash = None
+    db.session.commit()
+    logout_user()
+    jobs.submit(purge.delete_account, user_id)
+    flash('Your account is being deleted.', 'success')
+    return redirect(url_for('main.index'))
@@ -0,0 +1,32 @@
+from flask import request
+from flask_login import current_user
+from .. import db, entities, events, feed, search, timeline
+from ..models import User, bump_counter
+from ..pagination import page_size
+
+
+# Store a new tweet and push it to followers' timelines
+def publish_tweet(tweet):
+    db.session.add(tweet)
+    db.session.flush()
+    bump_counter(User.tweet_count, tweet.user_id, 1)
+    timeline.fan_out(tweet)
+    mentioned = entities.index_tweet(tweet)
+    db.session.commit()
+    events.emit('tweet_created', tweet_id=tweet.id, author_id=tweet.user_id)
+    for user_id in mentioned:
+        events.emit('user_mentioned', tweet_id=tweet.id, author_id=tweet.user_id, user_id=user_id)
+
+
+def run_search():
+    q = request.args.get('q', '').strip()
+    kind = 'users' if request.args.get('type') == 'users' else 'tweets'
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = page_size()
+    offset = (page - 1) * limit
+    if kind == 'users':
+        results, more = search.users(q, offset, limit)
+    else:
+        ids, more = search.tweet_ids(q, offset, limit)
+        results = feed.hydrate(ids, current_user if current_user.is_authenticated else None)
+    return q, kind, results, page + 1 if more else None
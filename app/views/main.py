@@ -0,0 +1,282 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, current_app
+from flask_login import login_required, current_user
+from .. import archive, db, events, feed, notifications, purge, suggestions, timeline, trends
+from ..broker import broker
+from ..cache import cache
+from ..database import read_only
+from ..engagement import engagement, LIKE, RETWEET
+from ..follow_graph import follow_graph, follow_states
+from ..forms import TweetForm, EditProfileForm, DeleteAccountForm
+from ..images import images, media_url, InvalidImage
+from ..models import User, Tweet, Hashtag, TweetHashtag
+from ..pagination import paginate
+from ..ratelimit import rate_limited
+from .common import publish_tweet, run_search
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/')
+def index():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+    return render_template('index.html')
+
+
+@bp.route('/home')
+def home():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+    return render_template('home.html')
+
+
+@bp.route('/dashboard', methods=['GET', 'POST'])
+@rate_limited('tweet', methods=('POST',))
+@login_required
+@read_only
+def dashboard():
+    form = TweetForm()
+    if form.validate_on_submit():
+        try:
+            tweet = Tweet(content=form.content.data, author=current_user)
+            if form.image.data:
+                tweet.image = images.store(form.image.data, 'tweets')
+            publish_tweet(tweet)
+
+            # Check if it's an AJAX request
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({
+                    'success': True,
+                    'message': 'Tweet posted successfully!',
+                    'tweet': {
+                        'id': tweet.id,
+                        'content': tweet.content,
+                        'author': {
+                            'username': tweet.author.username,
+                            'profile_image': tweet.author.profile_image,
+                            'profile_image_url': media_url('profile_pics', tweet.author.profile_image, 'thumb')
+                        },
+                        'image': tweet.image if tweet.image else None,
+                        'image_url': media_url('tweets', tweet.image) if tweet.image else None,
+                        'created_at': tweet.created_at.strftime('%b %d'),
+                        'likes_count': 0,
+                        'retweets_count': 0
+                    }
+                })
+
+            flash('Your tweet has been posted!', 'success')
+            return redirect(url_for('main.dashboard'))
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Posting a tweet failed')
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({
+                    'success': False,
+                    'message': 'Error posting tweet. Please try again.'
+                }), 500
+            flash('Error posting tweet. Please try again.', 'danger')
+            return redirect(url_for('main.dashboard'))
+
+    # Get tweets from the current user and people they follow
+    page = feed.hydrate_page(timeline.home_page(current_user, request.args.get('cursor')), current_user)
+
+    suggested_users = suggestions.for_user(current_user)
+    followed = follow_states(current_user.id, [u.id for u in suggested_users])
+
+    if form.errors and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({
+            'success': False,
+            'errors': form.errors
+        }), 400
+
+    return render_template('dashboard.html', form=form, tweets=page.items, next_cursor=page.next_cursor, suggested_users=suggested_users, followed=followed, trends=trends.top(3),
+                           unread=notifications.unread_count(current_user.id), notifications_preview=notifications.preview(current_user.id))
+
+
+@bp.route('/profile/<username>')
+@login_required
+@read_only
+def profile(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    if user.id == current_user.id:
+        relation = 'self'
+    else:
+        relation = 'following' if current_user.is_following(user) else 'not-following'
+    header = cache.fragment(
+        f"profile_header:{user.id}:{cache.version(f'user:{user.id}')}:{relation}",
+        lambda: render_template('_profile_header.html', user=user, following=relation == 'following')
+    )
+    page = feed.hydrate_page(archive.tweet_page(user.id, request.args.get('cursor')), current_user)
+
+    suggested_users = suggestions.for_user(current_user, exclude=(user.id,))
+    followed = follow_states(current_user.id, [u.id for u in suggested_users])
+
+    return render_template('profile.html', user=user, header=header, tweets=page.items, next_cursor=page.next_cursor, suggested_users=suggested_users, followed=followed)
+
+
+@bp.route('/edit_profile', methods=['GET', 'POST'])
+@login_required
+def edit_profile():
+    form = EditProfileForm(original_username=current_user.username)
+    if form.validate_on_submit():
+        current_user.username = form.username.data
+        current_user.email = form.email.data
+        current_user.bio = form.bio.data
+        current_user.location = form.location.data
+        current_user.website = form.website.data
+        if form.profile_image.data:
+            try:
+                current_user.profile_image = images.store(form.profile_image.data, 'profile_pics')
+            except InvalidImage as e:
+                form.profile_image.errors.append(str(e))
+                return render_template('edit_profile.html', form=form, delete_form=DeleteAccountForm())
+        db.session.commit()
+        events.emit('profile_updated', user_id=current_user.id)
+        flash('Your profile has been updated!', 'success')
+        return redirect(url_for('main.profile', username=current_user.username))
+    elif request.method == 'GET':
+        form.username.data = current_user.username
+        form.email.data = current_user.email
+        form.bio.data = current_user.bio
+        form.location.data = current_user.location
+        form.website.data = current_user.website
+    return render_template('edit_profile.html', form=form, delete_form=DeleteAccountForm())
+
+
+@bp.route('/follow/<username>')
+@rate_limited('engagement')
+@login_required
+def follow(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    if user == current_user:
+        flash('You cannot follow yourself!', 'danger')
+        return redirect(url_for('main.profile', username=username))
+    current_user.follow(user)
+    flash(f'You are now following {username}!', 'success')
+    return redirect(url_for('main.profile', username=username))
+
+
+@bp.route('/unfollow/<username>')
+@rate_limited('engagement')
+@login_required
+def unfollow(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    if user == current_user:
+        flash('You cannot unfollow yourself!', 'danger')
+        return redirect(url_for('main.profile', username=username))
+    current_user.unfollow(user)
+    flash(f'You have unfollowed {username}.', 'success')
+    return redirect(url_for('main.profile', username=username))
+
+
+@bp.route('/like/<int:tweet_id>')
+@rate_limited('engagement')
+@login_required
+def like(tweet_id):
+    tweet = Tweet.query.get_or_404(tweet_id)
+    liked = engagement.toggle(LIKE, current_user.id, tweet.id)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': True, 'liked': liked,
+                        'likes_count': tweet.like_count + engagement.delta(LIKE, tweet.id)})
+    flash('Tweet liked!' if liked else 'Tweet unliked!', 'success')
+    return redirect(request.referrer or url_for('main.dashboard'))
+
+
+@bp.route('/retweet/<int:tweet_id>')
+@rate_limited('engagement')
+@login_required
+def retweet(tweet_id):
+    tweet = Tweet.query.get_or_404(tweet_id)
+    xhr = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    if tweet.user_id == current_user.id:
+        if xhr:
+            return jsonify({'success': False, 'message': 'You cannot retweet your own tweet!'}), 400
+        flash('You cannot retweet your own tweet!', 'danger')
+        return redirect(request.referrer or url_for('main.dashboard'))
+    retweeted = engagement.toggle(RETWEET, current_user.id, tweet.id)
+    if xhr:
+        return jsonify({'success': True, 'retweeted': retweeted,
+                        'retweets_count': tweet.retweet_count + engagement.delta(RETWEET, tweet.id)})
+    flash('Tweet retweeted!' if retweeted else 'Retweet removed!', 'success')
+    return redirect(request.referrer or url_for('main.dashboard'))
+
+
+@bp.route('/delete_tweet/<int:tweet_id>', methods=['GET', 'POST'])
+@login_required
+def delete_tweet(tweet_id):
+    author_id = db.session.query(Tweet.user_id).filter(Tweet.id == tweet_id).scalar()
+    # Hand the session's connection back before purge checks out its own for the
+    # deletes, as purge.delete_account() does, so one request never holds two
+    db.session.rollback()
+    archived = None
+    if author_id is None:
+        archived = archive.archive.load([tweet_id]).get(tweet_id)
+        if archived is None:
+            abort(404)
+        author_id = archived.user_id
+    if author_id != current_user.id:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'You cannot delete this tweet.'}), 403
+        flash('You cannot delete this tweet.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    try:
+        # Likes, retweets, timeline entries, hashtags and mentions go with it
+        if archived is None:
+            purge.delete_tweets([tweet_id])
+        else:
+            purge.delete_archived_tweets([tweet_id])
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': True, 'message': 'Tweet deleted successfully!'})
+
+        flash('Tweet deleted successfully!', 'success')
+        return redirect(request.referrer or url_for('main.dashboard'))
+
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Deleting tweet %d failed', tweet_id)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'Error deleting tweet. Please try again.'}), 500
+
+        flash('Error deleting tweet. Please try again.', 'danger')
+        return redirect(request.referrer or url_for('main.dashboard'))
+
+
+@bp.route('/search')
+@login_required
+@read_only
+def search_page():
+    q, kind, results, next_page = run_search()
+    return render_template('search.html', q=q, kind=kind, results=results, next_page=next_page)
+
+
+@bp.route('/hashtag/<tag>')
+@login_required
+@read_only
+def hashtag(tag):
+    tag = Hashtag.query.filter_by(name=tag.lower()).first_or_404()
+    page = feed.hydrate_page(paginate(
+        db.session.query(TweetHashtag.tweet_id.label('id'), TweetHashtag.created_at).filter(
+            TweetHashtag.hashtag_id == tag.id
+        ),
+        TweetHashtag.created_at, TweetHashtag.tweet_id, request.args.get('cursor')
+    ), current_user)
+    return render_template('hashtag.html', tag=tag, tweets=page.items, next_cursor=page.next_cursor)
+
+
+# Opening the first page marks everything read; the rows were loaded before that
+@bp.route('/notifications')
+@login_required
+def notifications_page():
+    cursor = request.args.get('cursor')
+    page = notifications.page(current_user.id, cursor)
+    if not cursor:
+        notifications.mark_read(current_user.id)
+    return render_template('notifications.html', notifications=page.items, next_cursor=page.next_cursor)
+
+
+@bp.route('/stream')
+@login_required
+def stream():
+    return broker.stream(current_user.id, follow_graph.followees_of(current_user.id))
@@ -0,0 +1,18 @@
+import os
+from flask import Blueprint, abort
+from ..assets import assets
+from ..images import images, is_key
+
+bp = Blueprint('media', __name__)
+
+
+@bp.route('/media/<kind>/<filename>')
+def serve(kind, filename):
+    # Variant names are content hashes, so a served file never changes
+    key, _, variant = filename.rpartition('.')[0].partition('_')
+    if kind not in ('tweets', 'profile_pics') or not is_key(key):
+        abort(404)
+    exists = os.path.exists(os.path.join(images.directory(kind), filename))
+    if not exists and not images.render_now(kind, key, variant):
+        abort(404)
+    return assets.send(images.directory(kind), filename, immutable=True)
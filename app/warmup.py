@@ -0,0 +1,64 @@
+import time
+from importlib import import_module
+from sqlalchemy import orm
+from sqlalchemy.pool import QueuePool
+from . import db, trends
+from .archive import archive
+from .assets import assets
+
+# Work the first request after a fork would otherwise pay for. run() is meant
+# for the gunicorn master in preload mode (see gunicorn.conf.py): compiled
+# templates, configured mappers, the sorted URL map, static file digests, the
+# trends list and the modules request paths import lazily are then inherited
+# by every worker. SQLite connections must
+# never cross a fork, so run() and release() close the pools, and prime()
+# opens them again inside each worker.
+
+# Imported on first use by request paths: the Email validator pulls in
+# email_validator and dnspython, uploads pull in Pillow
+DEFERRED_IMPORTS = ('email_validator', 'PIL.Image', 'PIL.ImageOps')
+
+
+def _engines(app):
+    for bind in [None, *(app.config.get('SQLALCHEMY_BINDS') or ())]:
+        yield db.get_engine(app, bind)
+
+
+def run(app):
+    """Warm everything that can be shared with forked workers; returns {step: seconds}."""
+    timings = {}
+
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - start
+
+    step('imports', lambda: [import_module(name) for name in DEFERRED_IMPORTS])
+    with app.app_context():
+        step('mappers', orm.configure_mappers)
+        step('templates', lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()])
+        step('url_map', app.url_map.update)
+        if not app.config['ASSET_BUILD_ON_STARTUP']:
+            step('assets', assets.build)
+        step('trends', trends.top)
+        db.session.remove()
+    release(app)
+    return timings
+
+
+def release(app):
+    """Close every pooled connection; call before forking."""
+    for engine in _engines(app):
+        engine.dispose()
+    archive.dispose()
+
+
+def prime(app):
+    """Open each worker's connection pools before its first request."""
+    release(app)
+    for engine in _engines(app):
+        if not isinstance(engine.pool, QueuePool):
+            continue
+        connections = [engine.connect() for _ in range(engine.pool.size())]
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,175 @@
+"""Benchmark suite for the core routes.
+
+    python -m benchmarks generate --users 1000 --tweets 20000
+    python -m benchmarks run --requests 2000 --save benchmarks/baseline.json
+    python -m benchmarks run --http --workers 8 --compare benchmarks/baseline.json
+    python -m benchmarks logins --costs 100000,260000,600000
+    python -m benchmarks startup --runs 5
+
+"run" uses Flask's test client unless --http is given; --http starts the app on
+a local port (or targets --url, which must serve the same generated database).
+"logins" measures login throughput over HTTP at each PBKDF2 iteration count;
+it leaves the sampled users' passwords hashed at the last cost.
+"startup" starts fresh interpreters under -X importtime and reports import,
+create_app, warmup and first-request times, with and without warmup.
+"""
+import argparse
+import os
+import sys
+from config import Config
+from app import create_app
+from . import report
+from .runner import SCENARIOS, QueryCounter, Workload, instrument, run_http, run_logins, run_test_client, serve
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.db')
+
+
+def make_app(path, **overrides):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(path)
+        SQLALCHEMY_READ_DATABASE_URI = None
+        # Every benchmark session logs in from 127.0.0.1
+        RATELIMIT_ENABLED = False
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+    return create_app(BenchConfig)
+
+
+def generate(args):
+    from .datagen import generate
+    if os.path.exists(args.db) and not args.force:
+        sys.exit(f'{args.db} exists; pass --force to replace it.')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    app = make_app(args.db, JOBS_SYNC=True)
+    with app.app_context():
+        summary = generate(users=args.users, tweets=args.tweets, follows=args.follows, likes=args.likes,
+                           retweets=args.retweets, exponent=args.exponent, seed=args.seed)
+    print(f"Wrote {summary['users']} users, {summary['follows']} follows, {summary['tweets']} tweets to {args.db}")
+
+
+def run(args):
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}. Choose from {', '.join(SCENARIOS)}.")
+    if not args.url and not os.path.exists(args.db):
+        sys.exit(f'{args.db} does not exist; run "python -m benchmarks generate" first.')
+    meta = {'mode': 'http' if args.http or args.url else 'test-client', 'requests': args.requests,
+            'workers': args.workers if args.http or args.url else 1, 'db': os.path.basename(args.db)}
+    if args.http or args.url:
+        app = make_app(args.db)
+        instrument(app)
+        with app.app_context():
+            workload = Workload(args.seed)
+        server = None
+        url = args.url
+        if not url:
+            url, server = serve(app)
+        try:
+            with QueryCounter():
+                samples, wall = run_http(url, workload.user_ids, workload, names, args.requests,
+                                         args.warmup, args.workers)
+        finally:
+            if server is not None:
+                server.shutdown()
+    else:
+        app = make_app(args.db, WTF_CSRF_ENABLED=False)
+        samples, wall = run_test_client(app, names, args.requests, args.warmup, seed=args.seed)
+
+    result = report.summarize(samples, wall, meta)
+    print(report.table(result))
+    if args.save:
+        report.save(result, args.save)
+        print(f'Saved results to {args.save}')
+    if args.compare:
+        lines, regressed = report.compare(result, report.load(args.compare), args.threshold)
+        print(f'\nCompared with {args.compare}:')
+        print('\n'.join(lines))
+        if regressed and args.fail_on_regression:
+            sys.exit(1)
+
+
+def logins(args):
+    if not os.path.exists(args.db):
+        sys.exit(f'{args.db} does not exist; run "python -m benchmarks generate" first.')
+    print(f"{'iterations':>10}  {'logins/s':>8}  {'p50_ms':>7}  {'p95_ms':>7}  {'probe_p95_ms':>12}")
+    for cost in args.costs.split(','):
+        app = make_app(args.db, PASSWORD_HASH_METHOD=f'pbkdf2:sha256:{int(cost)}',
+                       PASSWORD_HASH_WORKERS=args.pool)
+        with app.app_context():
+            workload = Workload(args.seed)
+        user_ids = workload.rng.sample(workload.user_ids, min(args.users, len(workload.user_ids)))
+        url, server = serve(app)
+        try:
+            latencies, wall, probes = run_logins(url, user_ids, args.requests, args.workers)
+        finally:
+            server.shutdown()
+        latencies = sorted(seconds * 1000 for seconds in latencies)
+        probe_p95 = report.percentile(sorted(seconds * 1000 for seconds in probes), 95)
+        print(f'{int(cost):>10}  {len(latencies) / wall:>8.1f}  {report.percentile(latencies, 50):>7.1f}  '
+              f'{report.percentile(latencies, 95):>7.1f}  {probe_p95 or 0:>12.1f}')
+
+
+def startup(args):
+    from .startup import measure, table
+    if not os.path.exists(args.db):
+        sys.exit(f'{args.db} does not exist; run "python -m benchmarks generate" first.')
+    result = measure(os.path.abspath(args.db), args.runs)
+    print(table(result, args.top))
+    if args.save:
+        report.save(result, args.save)
+        print(f'Saved results to {args.save}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite file holding the generated data set')
+    parser.add_argument('--seed', type=int, default=42)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='create a synthetic data set')
+    gen.add_argument('--users', type=int, default=1000)
+    gen.add_argument('--tweets', type=int, default=20000)
+    gen.add_argument('--follows', type=int, default=30, help='mean accounts followed per user')
+    gen.add_argument('--likes', type=int, default=5, help='likes per user')
+    gen.add_argument('--retweets', type=int, default=1, help='retweets per user')
+    gen.add_argument('--exponent', type=float, default=1.1, help='power-law exponent of follower counts')
+    gen.add_argument('--force', action='store_true', help='replace an existing database')
+    gen.set_defaults(func=generate)
+
+    bench = commands.add_parser('run', help='replay the route mix and report latency')
+    bench.add_argument('--requests', type=int, default=1000)
+    bench.add_argument('--warmup', type=int, default=50)
+    bench.add_argument('--scenarios', help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    bench.add_argument('--http', action='store_true', help='drive a local server with concurrent workers')
+    bench.add_argument('--url', help='drive an already running server instead')
+    bench.add_argument('--workers', type=int, default=8)
+    bench.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    bench.add_argument('--compare', metavar='PATH', help='compare with saved results')
+    bench.add_argument('--threshold', type=float, default=0.2, help='allowed p95 slowdown, as a fraction')
+    bench.add_argument('--fail-on-regression', action='store_true', help='exit 1 when a scenario regressed')
+    bench.set_defaults(func=run)
+
+    login = commands.add_parser('logins', help='login throughput at several password hashing costs')
+    login.add_argument('--costs', default='100000,260000,600000', help='comma-separated PBKDF2 iteration counts')
+    login.add_argument('--requests', type=int, default=100)
+    login.add_argument('--workers', type=int, default=8)
+    login.add_argument('--pool', type=int, default=2, help='PASSWORD_HASH_WORKERS (0 hashes inline)')
+    login.add_argument('--users', type=int, default=20, help='accounts to sign in as')
+    login.set_defaults(func=logins)
+
+    start = commands.add_parser('startup', help='worker cold-start time, with and without warmup')
+    start.add_argument('--runs', type=int, default=5, help='interpreters started per mode')
+    start.add_argument('--top', type=int, default=15, help='packages listed by import time')
+    start.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    start.set_defaults(func=startup)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
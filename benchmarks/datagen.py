@@ -0,0 +1,110 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from app import counters, db, entities, migrations, suggestions, trends
+from app.passwords import passwords
+from app.models import User, Tweet, Retweet, Like, followers
+
+# Synthetic data set: follower counts follow a power law (a few accounts are
+# followed by most users), tweets and engagement lean towards popular authors.
+
+PASSWORD = 'benchmark'
+WORDS = ('flask sqlite python cache index query latency feed timeline tweet follow like '
+         'retweet stream search trend deploy profile batch worker queue').split()
+TAGS = ('python', 'flask', 'sqlite', 'perf', 'webdev', 'opensource')
+
+
+def _zipf_weights(n, exponent):
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def _content(rng, usernames):
+    words = rng.choices(WORDS, k=rng.randint(4, 20))
+    if rng.random() < 0.2:
+        words.append('#' + rng.choice(TAGS))
+    if rng.random() < 0.1:
+        words.append('@' + rng.choice(usernames))
+    return ' '.join(words)[:280]
+
+
+def generate(users=1000, tweets=20000, follows=30, likes=5, retweets=1, exponent=1.1, days=30, seed=42,
+             progress=print):
+    """Fill an empty, migrated database; returns a summary dict."""
+    rng = random.Random(seed)
+    migrations.upgrade(db.engine)
+    if db.session.query(User.id).first() is not None:
+        raise RuntimeError('The benchmark database is not empty.')
+
+    password_hash = passwords.hash(PASSWORD)
+    start = datetime.utcnow() - timedelta(days=days)
+    usernames = [f'user{i}' for i in range(1, users + 1)]
+    db.session.execute(insert(User), [
+        {'username': name, 'email': f'{name}@example.com', 'password_hash': password_hash,
+         'created_at': start, 'profile_image': 'default.jpg'}
+        for name in usernames
+    ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+    weights = _zipf_weights(len(user_ids), exponent)
+    progress(f'{users} users')
+
+    edges = set()
+    for follower in user_ids:
+        count = min(max(1, int(rng.expovariate(1 / follows))), len(user_ids) - 1)
+        for followed in rng.choices(user_ids, weights, k=count):
+            if followed != follower:
+                edges.add((follower, followed))
+    db.session.execute(insert(followers), [{'follower_id': a, 'followed_id': b} for a, b in edges])
+    progress(f'{len(edges)} follow edges')
+
+    span = days * 24 * 3600
+    authors = rng.choices(user_ids, weights, k=tweets)
+    stamps = sorted(start + timedelta(seconds=rng.uniform(0, span)) for _ in range(tweets))
+    for offset in range(0, tweets, 5000):
+        db.session.execute(insert(Tweet), [
+            {'content': _content(rng, usernames), 'user_id': author, 'created_at': created_at}
+            for author, created_at in zip(authors[offset:offset + 5000], stamps[offset:offset + 5000])
+        ])
+    tweet_ids = [tweet_id for tweet_id, in db.session.query(Tweet.id).order_by(Tweet.id)]
+    tweet_weights = _zipf_weights(len(tweet_ids), 0.8)
+    rng.shuffle(tweet_weights)
+    progress(f'{tweets} tweets')
+
+    for model, per_user in ((Like, likes), (Retweet, retweets)):
+        rows = set()
+        for user_id in user_ids:
+            for tweet_id in rng.choices(tweet_ids, tweet_weights, k=per_user):
+                rows.add((user_id, tweet_id))
+        db.session.execute(insert(model.__table__).prefix_with('OR IGNORE'), [
+            {'user_id': user_id, 'tweet_id': tweet_id, 'created_at': datetime.utcnow()} for user_id, tweet_id in rows
+        ])
+        progress(f'{len(rows)} {model.__tablename__}s')
+    db.session.commit()
+
+    _derive()
+    return {'users': users, 'follows': len(edges), 'tweets': tweets}
+
+
+def _derive():
+    from flask import current_app
+    counters.reconcile()
+    # Materialized timelines in one statement, trimmed to the configured length
+    db.session.execute(text('''
+    INSERT OR IGNORE INTO timeline (user_id, tweet_id, author_id, created_at)
+    SELECT user_id, tweet_id, author_id, created_at FROM (
+        SELECT reader AS user_id, tweet_id, author_id, created_at,
+               row_number() OVER (PARTITION BY reader ORDER BY created_at DESC) AS position
+        FROM (
+            SELECT t.user_id AS reader, t.id AS tweet_id, t.user_id AS author_id, t.created_at FROM tweet t
+            UNION ALL
+            SELECT f.follower_id, t.id, t.user_id, t.created_at FROM tweet t JOIN followers f ON f.followed_id = t.user_id
+        )
+    ) WHERE position <= :limit
+    '''), {'limit': current_app.config['TIMELINE_MAX_LENGTH']})
+    db.session.commit()
+    for user_id, in db.session.query(User.id).all():
+        suggestions.rebuild(user_id)
+    tagged = Tweet.query.filter(Tweet.content.contains('#') | Tweet.content.contains('@'))
+    for tweet in tagged.yield_per(500):
+        entities.index_tweet(tweet)
+    db.session.commit()
+    trends.rebuild()
@@ -0,0 +1,102 @@
+import json
+import math
+import platform
+from collections import defaultdict
+from datetime import datetime
+
+# Summaries of raw (scenario, seconds, status, queries) samples, and the
+# comparison of a run against a saved baseline.
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    # Nearest-rank on a sorted list
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _stats(samples, wall):
+    latencies = sorted(elapsed * 1000 for _, elapsed, _, _ in samples)
+    queries = [count for _, _, _, count in samples if count is not None]
+    stats = {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status, _ in samples if status >= 400),
+        'rps': round(len(samples) / wall, 1) if wall else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        stats[f'p{p}_ms'] = round(value, 2) if value is not None else None
+    return stats
+
+
+def summarize(samples, wall, meta):
+    by_name = defaultdict(list)
+    for sample in samples:
+        by_name[sample[0]].append(sample)
+    # Per-scenario throughput is its share of the whole run's wall time
+    return {
+        'meta': dict(meta, created_at=datetime.utcnow().isoformat(timespec='seconds'),
+                     python=platform.python_version(), machine=platform.machine()),
+        'total': _stats(samples, wall),
+        'scenarios': {name: _stats(items, wall) for name, items in sorted(by_name.items())},
+    }
+
+
+def save(result, path):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:g}'
+
+
+def table(result):
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+    rows = [(name, *(_fmt(stats[c]) for c in columns)) for name, stats in result['scenarios'].items()]
+    rows.append(('TOTAL', *(_fmt(result['total'][c]) for c in columns)))
+    header = ('scenario',) + columns
+    widths = [max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))]
+    lines = ['  '.join(str(cell).rjust(width) if i else str(cell).ljust(width)
+                       for i, (cell, width) in enumerate(zip(row, widths)))
+             for row in [header] + rows]
+    return '\n'.join(lines)
+
+
+def compare(result, baseline, threshold=0.2):
+    """Lines describing p95 and query-count changes, and whether any scenario regressed."""
+    lines = []
+    regressed = False
+    if baseline['meta'].get('mode') != result['meta'].get('mode'):
+        lines.append(f"warning: baseline was a {baseline['meta'].get('mode')} run, this is a {result['meta']['mode']} run")
+    for name, stats in result['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            lines.append(f'{name}: new scenario')
+            continue
+        notes = []
+        if stats['p95_ms'] is not None and before.get('p95_ms'):
+            change = stats['p95_ms'] / before['p95_ms'] - 1
+            notes.append(f"p95 {before['p95_ms']:g} -> {stats['p95_ms']:g} ms ({change:+.0%})")
+            if change > threshold:
+                notes[-1] += ' REGRESSION'
+                regressed = True
+        if stats['queries'] is not None and before.get('queries') is not None:
+            notes.append(f"queries {before['queries']:g} -> {stats['queries']:g}")
+            if stats['queries'] > before['queries'] + 0.5:
+                notes[-1] += ' REGRESSION'
+                regressed = True
+        lines.append(f"{name}: {', '.join(notes) or 'no comparable figures'}")
+    return lines, regressed
@@ -0,0 +1,280 @@
+import http.cookiejar
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import db
+from app.models import User, Tweet, Hashtag
+from .datagen import PASSWORD, WORDS
+
+# Replays a weighted mix of the core routes against a generated database, either
+# through Flask's test client (one thread, no network) or over HTTP with
+# several worker threads, and records latency and SQL statements per request.
+
+QUERY_HEADER = 'X-Query-Count'
+CSRF_INPUT = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class Workload:
+    """Ids and names the scenarios draw their URLs from."""
+
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+        self.user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+        self.usernames = [name for name, in db.session.query(User.username).order_by(User.follower_count.desc()).limit(200)]
+        self.tweet_ids = [tweet_id for tweet_id, in db.session.query(Tweet.id).order_by(Tweet.id.desc()).limit(2000)]
+        self.tags = [name for name, in db.session.query(Hashtag.name)] or ['python']
+        if not self.user_ids or not self.tweet_ids:
+            raise RuntimeError('The benchmark database is empty; run "python -m benchmarks generate" first.')
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def popular_username(self):
+        return self.rng.choice(self.usernames)
+
+    def tweet(self):
+        return self.rng.choice(self.tweet_ids)
+
+    def word(self):
+        return self.rng.choice(WORDS)
+
+    def tag(self):
+        return self.rng.choice(self.tags)
+
+
+# name: (weight, method, url builder, json body builder)
+SCENARIOS = {
+    'dashboard': (20, 'GET', lambda w: '/dashboard', None),
+    'profile': (15, 'GET', lambda w: f'/profile/{w.popular_username()}', None),
+    'api_tweets': (10, 'GET', lambda w: '/api/tweets', None),
+    'api_feed': (10, 'GET', lambda w: '/api/feed', None),
+    'v2_timeline': (5, 'GET', lambda w: '/api/v2/timeline?limit=200', None),
+    'search': (5, 'GET', lambda w: f'/search?q={w.word()}', None),
+    'hashtag': (5, 'GET', lambda w: f'/hashtag/{w.tag()}', None),
+    'like': (15, 'POST', lambda w: f'/api/like/{w.tweet()}', None),
+    'follow': (5, 'POST', lambda w: f'/api/follow/{w.user()}', None),
+    'post_tweet': (5, 'POST', lambda w: '/api/tweets',
+                   lambda w: {'content': ' '.join(w.word() for _ in range(8))}),
+}
+
+
+class QueryCounter:
+    """Counts SQL statements per thread, over every engine (primary and read bind)."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+        if has_request_context():
+            g.benchmark_queries = g.get('benchmark_queries', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+
+def instrument(app):
+    # Report the statement count of each request to HTTP clients; statements run
+    # while a streamed body is being sent are not included
+    @app.after_request
+    def report_queries(response):
+        response.headers[QUERY_HEADER] = str(g.get('benchmark_queries', 0))
+        return response
+
+
+def _plan(workload, names, count):
+    weights = [SCENARIOS[name][0] for name in names]
+    plan = []
+    for name in workload.rng.choices(names, weights, k=count):
+        _, method, url, body = SCENARIOS[name]
+        plan.append((name, method, url(workload), body(workload) if body else None))
+    return plan
+
+
+def _credentials(user_id):
+    # Matches the accounts written by datagen.generate()
+    return f'user{user_id}@example.com', PASSWORD
+
+
+def run_test_client(app, names, requests=1000, warmup=50, sessions=20, seed=1):
+    """Single-threaded run through app.test_client(); returns raw samples."""
+    with app.app_context():
+        workload = Workload(seed)
+        clients = []
+        for user_id in workload.rng.sample(workload.user_ids, min(sessions, len(workload.user_ids))):
+            client = app.test_client()
+            email, password = _credentials(user_id)
+            response = client.post('/login', data={'email': email, 'password': password})
+            if response.status_code != 302:
+                raise RuntimeError(f'Could not log in as {email}.')
+            clients.append(client)
+        plan = _plan(workload, names, warmup + requests)
+    samples = []
+    with QueryCounter() as counter:
+        started = time.perf_counter()
+        for i, (name, method, url, body) in enumerate(plan):
+            client = clients[i % len(clients)]
+            counter.reset()
+            begin = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            elapsed = time.perf_counter() - begin
+            if i == warmup:
+                started = begin
+            if i >= warmup:
+                samples.append((name, elapsed, response.status_code, counter.count))
+        wall = time.perf_counter() - started
+    return samples, wall
+
+
+class HttpSession:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(_NoRedirect, urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_cookie(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrf_token':
+                return cookie.value
+        return None
+
+    def open(self, url, method='GET', json_body=None, form=None):
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        token = self.csrf_cookie()
+        if method == 'POST' and token:
+            headers['X-CSRFToken'] = token
+        request = urllib.request.Request(self.base_url + url, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers, error.read()
+
+    def login(self, email, password):
+        status, _, body = self.open('/login')
+        match = CSRF_INPUT.search(body.decode('utf-8', 'replace'))
+        form = {'email': email, 'password': password}
+        if match:
+            form['csrf_token'] = match.group(1)
+        status, _, _ = self.open('/login', 'POST', form=form)
+        if status != 302:
+            raise RuntimeError(f'Could not log in as {email}.')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_http(base_url, user_ids, workload, names, requests=1000, warmup=50, workers=8):
+    """Closed-loop load: each worker thread has its own logged-in session."""
+    sessions = []
+    for user_id in workload.rng.sample(user_ids, min(workers, len(user_ids))):
+        session = HttpSession(base_url)
+        session.login(*_credentials(user_id))
+        sessions.append(session)
+    plan = _plan(workload, names, warmup + requests)
+    for name, method, url, body in plan[:warmup]:
+        sessions[0].open(url, method, body)
+    lock = threading.Lock()
+    pending = iter(plan[warmup:])
+    samples = []
+
+    def worker(session):
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            name, method, url, body = item
+            begin = time.perf_counter()
+            status, headers, _ = session.open(url, method, body)
+            elapsed = time.perf_counter() - begin
+            queries = headers.get(QUERY_HEADER)
+            with lock:
+                samples.append((name, elapsed, status, int(queries) if queries is not None else None))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        list(executor.map(worker, sessions))
+    return samples, time.perf_counter() - started
+
+
+def run_logins(base_url, user_ids, requests=200, workers=8, probe='/api/tweets'):
+    """Concurrent fresh logins, plus one thread timing `probe` to show what a
+    login storm does to other traffic. Returns (login seconds, wall, probe seconds)."""
+    for user_id in user_ids:
+        # The first login may rehash the password to the configured cost
+        HttpSession(base_url).login(*_credentials(user_id))
+    lock = threading.Lock()
+    pending = iter(range(requests))
+    latencies, probes = [], []
+    done = threading.Event()
+
+    def worker(offset):
+        while True:
+            with lock:
+                i = next(pending, None)
+            if i is None:
+                return
+            begin = time.perf_counter()
+            HttpSession(base_url).login(*_credentials(user_ids[(i + offset) % len(user_ids)]))
+            with lock:
+                latencies.append(time.perf_counter() - begin)
+
+    def prober():
+        session = HttpSession(base_url)
+        while not done.is_set():
+            begin = time.perf_counter()
+            session.open(probe)
+            probes.append(time.perf_counter() - begin)
+            time.sleep(0.01)
+
+    probe_thread = threading.Thread(target=prober, daemon=True)
+    probe_thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    wall = time.perf_counter() - started
+    done.set()
+    probe_thread.join()
+    return latencies, wall, probes
+
+
+def serve(app):
+    """Start the app on a free local port in a background thread; returns (url, server)."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from .runner import _credentials
+
+# Cold start of one worker, measured in fresh interpreters. Each child runs
+# under `python -X importtime`, which breaks the import phase down by module,
+# then times create_app(), the optional warmup (app/warmup.py) and its first
+# requests: an anonymous page, then the dashboard of a logged-in user. Runs
+# alternate between cold and warmed children so both see the same disk cache.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from config import Config
+
+class StartupConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + sys.argv[1]
+    SQLALCHEMY_READ_DATABASE_URI = None
+    RATELIMIT_ENABLED = False
+    WTF_CSRF_ENABLED = False
+
+application = app.create_app(StartupConfig)
+created = time.perf_counter()
+if sys.argv[2] == '1':
+    from app import warmup
+    warmup.run(application)
+    warmup.prime(application)
+warmed = time.perf_counter()
+
+client = application.test_client()
+requests = []
+def get(label, path):
+    begin = time.perf_counter()
+    status = client.get(path).status_code
+    requests.append((label, status, time.perf_counter() - begin))
+get('GET /login (1st)', '/login')
+get('GET /login (2nd)', '/login')
+client.post('/login', data={'email': sys.argv[3], 'password': sys.argv[4]})
+get('GET /dashboard (1st)', '/dashboard')
+get('GET /dashboard (2nd)', '/dashboard')
+print(json.dumps({'import app': imported - start, 'create_app': created - imported,
+                  'warmup': warmed - created, 'requests': requests}))
+'''
+
+
+def parse_importtime(stderr):
+    """Self time in seconds per top-level package, from -X importtime output."""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            packages[match[4].split('.')[0]] += int(match[1]) / 1e6
+    return packages
+
+
+def _child(db_path, warm, email, password):
+    begin = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, db_path, '1' if warm else '0',
+                              email, password], cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - begin
+    if process.returncode:
+        raise RuntimeError(f'Startup child failed:\n{process.stderr[-2000:]}')
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    for label, status, _ in result['requests']:
+        if status >= 400:
+            raise RuntimeError(f'{label} returned {status}.')
+    result['process'] = wall
+    result['imports'] = parse_importtime(process.stderr)
+    return result
+
+
+def _median(values):
+    return round(statistics.median(values) * 1000, 1)
+
+
+def measure(db_path, runs=5, user_id=1):
+    """Median phase timings (ms) for cold and warmed workers over `runs` children each."""
+    email, password = _credentials(user_id)
+    samples = {'cold': [], 'warm': []}
+    for _ in range(runs):
+        for mode in samples:
+            samples[mode].append(_child(db_path, mode == 'warm', email, password))
+    result = {'runs': runs}
+    for mode, children in samples.items():
+        phases = {name: _median([child[name] for child in children])
+                  for name in ('process', 'import app', 'create_app', 'warmup')}
+        for i, (label, _, _) in enumerate(children[0]['requests']):
+            phases[label] = _median([child['requests'][i][2] for child in children])
+        packages = {name for child in children for name in child['imports']}
+        result[mode] = {
+            'phases': phases,
+            'imports': {name: _median([child['imports'].get(name, 0) for child in children]) for name in packages},
+        }
+    return result
+
+
+def table(result, top=15):
+    cold, warm = result['cold'], result['warm']
+    lines = [f"{'phase (median ms)':<24}{'cold':>9}{'warm':>9}"]
+    for name in cold['phases']:
+        lines.append(f"{name:<24}{cold['phases'][name]:>9.1f}{warm['phases'][name]:>9.1f}")
+    lines.append('')
+    lines.append(f"{'import self time (ms)':<24}{'cold':>9}")
+    for name, ms in sorted(cold['imports'].items(), key=lambda item: -item[1])[:top]:
+        lines.append(f'{name:<24}{ms:>9.1f}')
+    return '\n'.join(lines)
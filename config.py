@@ -9,3 +9,100 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app/static')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Raw uploads wait here, outside the static folder, until their variants are written
+    IMAGE_INCOMING_FOLDER = os.environ.get('IMAGE_INCOMING_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 2)
+    # Static files get content-hashed URLs; CSS/JS are precompressed into ASSET_BUILD_DIR
+    ASSET_BUILD_DIR = os.environ.get('ASSET_BUILD_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'assets')
+    ASSET_BUILD_ON_STARTUP = True
+    ASSET_PRECOMPRESS = ('.css', '.js', '.svg')
+    ASSET_MAX_AGE = 365 * 24 * 3600
+    # None, 'x-sendfile' or 'x-accel-redirect': let the front server send file bodies
+    ASSET_SENDFILE = os.environ.get('ASSET_SENDFILE') or None
+    ASSET_ACCEL_PREFIX = '/_files'
+
+    # SQLite engine profile, applied to every pooled connection
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # in KiB, so 64MB per connection
+        'temp_store': 'MEMORY',
+    }
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = 30
+    # GET feed/profile views read through a separate pool (or a replica, if set)
+    DB_READ_SPLIT = True
+    SQLALCHEMY_READ_DATABASE_URI = os.environ.get('READ_DATABASE_URL')
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE') or 10)
+
+    # 'memory' is per worker; 'file' is shared by all workers on the host; 'null' disables caching
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'memory'
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+    CACHE_DEFAULT_TTL = 300
+    CACHE_MAX_ENTRIES = 4096
+    # How often the file cache removes expired entries and trims itself to CACHE_MAX_ENTRIES
+    CACHE_SWEEP_INTERVAL = 60
+    CACHE_API_TTL = 30
+    # Logged-in user rows and follow sets, per worker
+    VIEWER_CACHE_SIZE = 10000
+    VIEWER_CACHE_TTL = 60
+    # Follow graph adjacency arrays, per worker
+    FOLLOW_GRAPH_MAX_USERS = 50000
+    FOLLOW_GRAPH_TTL = 60
+    TIMELINE_MAX_LENGTH = int(os.environ.get('TIMELINE_MAX_LENGTH') or 800)
+    TIMELINE_TRIM_SLACK = 50
+    FEED_PAGE_SIZE = 20
+    FEED_MAX_PAGE_SIZE = 100
+    SUGGESTIONS_PER_USER = 50
+    TRENDS_BUCKET_SECONDS = 600
+    TRENDS_WINDOW = 24 * 3600
+    TRENDS_HALF_LIFE = 2 * 3600
+    TRENDS_TOP_K = 10
+    TRENDS_REFRESH = 60
+    # Background jobs run on a thread pool; JOBS_SYNC runs them inline (tests, CLI)
+    JOBS_SYNC = os.environ.get('JOBS_SYNC', '').lower() in ('1', 'true', 'yes')
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS') or 2)
+    # Like/retweet/follow toggles are queued and committed in batches by a flusher thread
+    ENGAGEMENT_WRITE_BEHIND = os.environ.get('ENGAGEMENT_WRITE_BEHIND', '1').lower() in ('1', 'true', 'yes')
+    ENGAGEMENT_FLUSH_INTERVAL = float(os.environ.get('ENGAGEMENT_FLUSH_INTERVAL') or 0.05)
+    ENGAGEMENT_BATCH_SIZE = 500
+    # Notifications are queued and aggregated per recipient, kind and tweet within NOTIFICATIONS_WINDOW seconds
+    NOTIFICATIONS_WINDOW = 3600
+    NOTIFICATIONS_FLUSH_INTERVAL = float(os.environ.get('NOTIFICATIONS_FLUSH_INTERVAL') or 1.0)
+    NOTIFICATIONS_BATCH_SIZE = 1000
+    NOTIFICATIONS_UNREAD_TTL = 10
+    # `flask archive-tweets` (run it from cron) moves tweets older than ARCHIVE_AFTER_DAYS to one SQLite file per year in ARCHIVE_DIR
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 365)
+    ARCHIVE_BATCH_SIZE = 1000
+    # Rows per transaction when deleting tweets and accounts
+    PURGE_BATCH_SIZE = 500
+    # Live updates over /stream; each open stream holds a worker thread (use a gevent worker in production)
+    BROKER_TYPE = os.environ.get('BROKER_TYPE') or 'memory'
+    STREAM_QUEUE_SIZE = 256
+    STREAM_KEEPALIVE = 15
+    # Per-request SQL/template profiling: Server-Timing header, JSON log line, /_metrics histograms
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    SERVER_TIMING = True
+    REQUEST_LOG = os.environ.get('REQUEST_LOG', '').lower() in ('1', 'true', 'yes')
+    PROFILE_SLOWEST_STATEMENTS = 3
+    METRICS_ENDPOINT = True
+    # Request throttling; 'memory' is per worker, 'sqlite' is shared by all workers on the host
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE') or 'memory'
+    RATELIMIT_SQLITE_PATH = os.environ.get('RATELIMIT_SQLITE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'ratelimit.db')
+    RATE_LIMITS = {
+        'login': {'limit': '10/minute', 'by': 'ip', 'algorithm': 'sliding_window'},
+        'signup': {'limit': '5/hour', 'by': 'ip', 'algorithm': 'sliding_window'},
+        'tweet': {'limit': '30/minute', 'by': 'user', 'algorithm': 'token_bucket'},
+        'engagement': {'limit': '120/minute', 'by': 'user', 'algorithm': 'token_bucket'},
+    }
+    # Password hashing cost and pool (0 workers hashes inline); existing hashes are upgraded on login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:260000'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_QUEUE = 32
+    PASSWORD_HASH_TIMEOUT = 10
@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py
+#
+# The app is imported once, in the master, and warmed there before any worker
+# forks (app/warmup.py), so a worker starts with templates compiled and mappers
+# configured, and a restarted worker costs a fork rather than an import. Each
+# worker opens its own database pool before it takes requests. Archiving is
+# not done here: run `flask archive-tweets` from cron. BROKER_TYPE 'memory' delivers
+# /stream events only to clients of the worker that published them.
+
+wsgi_app = 'run:app'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+# Threads keep long-lived /stream connections from tying up a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 8)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 0)
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 30
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import warmup
+        timings = warmup.run(server.app.wsgi())
+        server.log.info('Warmed up: %s', ', '.join(f'{name} {seconds * 1000:.0f}ms'
+                                                  for name, seconds in timings.items()))
+
+
+def post_worker_init(worker):
+    from app import warmup
+    if not worker.cfg.preload_app:
+        warmup.run(worker.wsgi)
+    warmup.prime(worker.wsgi)